@@ -1,12 +1,25 @@
 import random
 import logging
 import traceback
-from datetime import datetime, timedelta, time
+import multiprocessing
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from timetable import DAY_TYPES, StopIndex, to_minutes, format_minutes
+from fitness_workers import init_worker, evaluate_genomes
+from genetic_algorithm import get_day_type
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Weight of each metric in the fitness score
+FITNESS_WEIGHTS = {
+    'waiting_time': 0.35,
+    'utilization': 0.25,
+    'peak_coverage': 0.25,
+    'cost': 0.15
+}
+
 class BusScheduleOptimizer:
     def __init__(self, optimization_data):
         """
@@ -44,47 +57,65 @@ class BusScheduleOptimizer:
         # Determine peak hours
         self.peak_hours = set(self.demand_patterns.get('peak_hours', []))
 
+        # Stop -> routes index for request-to-route lookups
+        self.stop_index = StopIndex(self.current_schedules)
+
+        # Axis order of the routes and peak hours in _encode_population arrays
+        self.route_names = list(self.current_schedules)
+        self.peak_mask = np.array([hour in self.peak_hours for hour in range(24)])
+        self.current_fleet_sizes = np.array(
+            [self.current_fleet.get(route, 1) for route in self.route_names], dtype=float
+        )
+
+        # (route, day_type) -> generated departures, shared by every individual
+        self._day_schedules = {}
+
+        # Trip requests collapsed once per run for the waiting time metric
+        self.demand_histogram = self._build_demand_histogram()
+
     def _find_route(self, start, end):
         """Find route containing both start and end points"""
-        for route_name, route_data in self.current_schedules.items():
-            if start in route_data.get('stops', []) and end in route_data.get('stops', []):
-                return route_name
-        return None
-
-    def _find_closest_departure(self, schedules, desired_time):
-        """Find the closest departure time to the desired time"""
-        closest_time = None
-        min_diff = float('inf')
-        
-        for bus_schedules in schedules.values():
-            for day_type, departure_times in bus_schedules.items():
-                # Skip day type strings and ensure we're working with a list of times
-                if not isinstance(departure_times, list):
-                    continue
-                
-                for departure_time in departure_times:
-                    try:
-                        # Convert departure time to datetime for comparison
-                        dep_time = datetime.strptime(str(departure_time), '%H:%M').time()
-                        
-                        # Calculate time difference
-                        time_diff = abs(
-                            (datetime.combine(datetime.today(), dep_time) - 
-                             datetime.combine(datetime.today(), desired_time)).total_seconds()
-                        )
-                        
-                        # Update closest time if this is closer
-                        if time_diff < min_diff:
-                            min_diff = time_diff
-                            closest_time = dep_time
-                    except ValueError:
-                        # Skip times that can't be parsed
-                        continue
-        
-        return closest_time
+        routes = self.stop_index.common_routes(start, end)
+        return routes[0] if routes else None
+
+    def _build_demand_histogram(self):
+        """
+        Trip requests per (route, day type) as parallel arrays of distinct
+        desired minutes and request counts, so the waiting time metric costs
+        the same however many requests there are
+        """
+        counts = defaultdict(lambda: defaultdict(int))
+        for request in self.trip_requests:
+            route = self._find_route(request.starting_point, request.destination)
+            if route:
+                day_type = get_day_type(request.desired_time.strftime('%A').lower())
+                counts[(route, day_type)][to_minutes(request.desired_time)] += 1
+
+        histogram = {}
+        for key, minute_counts in counts.items():
+            minutes = sorted(minute_counts)
+            histogram[key] = (
+                np.array(minutes, dtype=np.int64),
+                np.array([minute_counts[minute] for minute in minutes], dtype=np.int64)
+            )
+        return histogram
+
+    def _route_departures(self, individual, route, day_type):
+        """Sorted departures of every bus on route for day_type in individual"""
+        buses = individual['schedules'].get(route, {})
+        departures = [np.asarray(bus.get(day_type, ()), dtype=np.int64) for bus in buses.values()]
+        return np.unique(np.concatenate(departures)) if departures else np.array([], dtype=np.int64)
 
     def _generate_day_schedule(self, route, day_type):
-        """Generate schedule for entire day based on demand patterns"""
+        """
+        Generate schedule for entire day based on demand patterns, as sorted
+        minutes since midnight. The demand patterns are fixed for the run, so
+        each route and day type is generated once and the tuple is shared.
+        """
+        key = (route, day_type)
+        if key in self._day_schedules:
+            return self._day_schedules[key]
+
         schedule = []
         operating_hours = range(5, 23)  # 5 AM to 10 PM
 
@@ -102,9 +133,10 @@ class BusScheduleOptimizer:
             
             # Generate departure times
             for minute in range(0, 60, frequency):
-                schedule.append(f"{hour:02d}:{minute:02d}")
+                schedule.append(hour * 60 + minute)
         
-        return sorted(schedule)
+        self._day_schedules[key] = tuple(sorted(schedule))
+        return self._day_schedules[key]
 
     def _create_individual(self):
         """Create initial solution with fleet allocation and schedules"""
@@ -150,43 +182,96 @@ class BusScheduleOptimizer:
             'cost': self._evaluate_cost_efficiency(individual)
         }
         
-        # Add debug print to see actual values
-        print("Fitness Metrics:", {k: f"{v:.2f}" for k, v in metrics.items()})
+        logging.debug(f"Fitness Metrics: { {k: f'{v:.2f}' for k, v in metrics.items()} }")
         
         individual['fitness_metrics'] = metrics
         
         # Weighted sum of metrics
-        weights = {
-            'waiting_time': 0.35,
-            'utilization': 0.25,
-            'peak_coverage': 0.25,
-            'cost': 0.15
+        return sum(score * FITNESS_WEIGHTS[metric] for metric, score in metrics.items())
+
+    def _encode_population(self, population):
+        """
+        Trips per hour of every individual as an (individuals x routes x
+        day_types x 24) array summed over each route's buses, with the
+        (individuals x routes) fleet sizes
+        """
+        trips = np.zeros((len(population), len(self.route_names), len(DAY_TYPES), 24), dtype=np.int64)
+        fleet = np.zeros((len(population), len(self.route_names)))
+
+        for i, individual in enumerate(population):
+            for r, route in enumerate(self.route_names):
+                fleet[i, r] = individual['fleet'][route]
+                for bus_schedules in individual['schedules'][route].values():
+                    for d, day_type in enumerate(DAY_TYPES):
+                        minutes = np.asarray(bus_schedules.get(day_type, ()), dtype=np.int64)
+                        trips[i, r, d] += np.bincount(minutes // 60, minlength=24)
+
+        return trips, fleet
+
+    def _evaluate_population(self, population):
+        """
+        _calculate_fitness for a whole population at once. Utilization, peak
+        coverage and cost are array operations over _encode_population;
+        waiting time still goes through _evaluate_waiting_time per individual.
+        Returns a fitness array in population order.
+        """
+        if not population or not self.route_names:
+            return np.array([self._calculate_fitness(individual) for individual in population])
+
+        trips, fleet = self._encode_population(population)
+
+        # Scheduled trips against fleet size * 3 day types * 6 trips per day
+        schedule_count = trips.sum(axis=(2, 3))
+        utilization = np.minimum(1.0, schedule_count / (fleet * 3 * 6)).mean(axis=1)
+
+        # Trips in peak hours against 4 slots per peak hour; an empty trip log
+        # has no peaks, so there is nothing to cover
+        total_peak_slots = len(self.peak_hours) * 4
+        if total_peak_slots == 0:
+            peak_coverage = np.zeros(len(population))
+        else:
+            peak_trips = trips[..., self.peak_mask].sum(axis=(2, 3))
+            peak_coverage = np.minimum(1, peak_trips / total_peak_slots).mean(axis=1)
+
+        # Fleet size changes against the larger of the current and proposed fleets
+        total_cost = (np.abs(fleet - self.current_fleet_sizes) * 0.2).sum(axis=1)
+        cost = 1 - total_cost / np.maximum(self.current_fleet_sizes, fleet).sum(axis=1)
+
+        waiting_time = np.array([self._evaluate_waiting_time(individual) for individual in population])
+
+        metrics = {
+            'waiting_time': waiting_time,
+            'utilization': utilization,
+            'peak_coverage': peak_coverage,
+            'cost': cost
         }
-        
-        return sum(score * weights[metric] for metric, score in metrics.items())
+        for i, individual in enumerate(population):
+            individual['fitness_metrics'] = {metric: float(values[i]) for metric, values in metrics.items()}
+
+        return sum(values * FITNESS_WEIGHTS[metric] for metric, values in metrics.items())
 
     def _evaluate_waiting_time(self, individual):
-        """Evaluate average passenger waiting time"""
+        """
+        Evaluate average passenger waiting time: the distance from each
+        request's desired minute to the nearest departure of its route on
+        its day type, weighted by the demand histogram
+        """
         total_wait = 0
         request_count = 0
         
-        for request in self.trip_requests:
-            route = self._find_route(request.starting_point, request.destination)
-            if route and route in individual['schedules']:
-                desired_time = request.desired_time.time()
-                closest_time = self._find_closest_departure(
-                    individual['schedules'],
-                    desired_time
-                )
-                
-                if closest_time:
-                    wait_time = abs((
-                        datetime.combine(datetime.today(), closest_time) - 
-                        datetime.combine(datetime.today(), desired_time)
-                    ).total_seconds() / 60)
-                    
-                    total_wait += min(wait_time, 60)  # Cap at 60 minutes
-                    request_count += 1
+        for (route, day_type), (minutes, weights) in self.demand_histogram.items():
+            departures = self._route_departures(individual, route, day_type)
+            if not len(departures):
+                continue
+
+            # Nearest departure on either side of each desired minute
+            idx = np.searchsorted(departures, minutes)
+            before = departures[np.maximum(idx - 1, 0)]
+            after = departures[np.minimum(idx, len(departures) - 1)]
+            wait_time = np.minimum(np.abs(minutes - before), np.abs(after - minutes))
+
+            total_wait += int((np.minimum(wait_time, 60) * weights).sum())  # Cap at 60 minutes
+            request_count += int(weights.sum())
         
         return 1 - (total_wait / (request_count * 60)) if request_count > 0 else 0
 
@@ -219,7 +304,10 @@ class BusScheduleOptimizer:
             return 0
 
     def _evaluate_peak_coverage(self, individual):
-        """Evaluate coverage during peak hours"""
+        """Evaluate coverage during peak hours, 0 when there are no peak hours"""
+        if not self.peak_hours:
+            return 0
+
         peak_coverage = 0
         for route in individual['fleet']:
             peak_trips = 0
@@ -227,8 +315,8 @@ class BusScheduleOptimizer:
             
             for bus in individual['schedules'][route].values():
                 for schedule in bus.values():
-                    peak_trips += sum(1 for time in schedule 
-                                    if int(time.split(':')[0]) in self.peak_hours)
+                    peak_trips += sum(1 for minute in schedule 
+                                    if minute // 60 in self.peak_hours)
             
             peak_coverage += min(1, peak_trips / total_peak_slots)
         
@@ -300,10 +388,57 @@ class BusScheduleOptimizer:
         
         return mutated
 
-    def optimize(self, population_size=50, generations=30, mutation_rate=0.1):
-        """Main optimization process"""
+    def _genome(self, individual):
+        """Fleet size per route, in route_names order"""
+        return tuple(individual['fleet'][route] for route in self.route_names)
+
+    def _decode_genome(self, genome):
+        """
+        Rebuild an individual from its genome. Every bus on a route runs the
+        route's generated day schedules (see _create_individual and _mutate),
+        so fleet sizes are all that distinguish two individuals.
+        """
+        individual = {'fleet': {}, 'schedules': defaultdict(dict)}
+        for route, fleet_size in zip(self.route_names, genome):
+            individual['fleet'][route] = fleet_size
+            for bus_id in range(fleet_size):
+                individual['schedules'][route][f"bus_{bus_id}"] = {
+                    day_type: self._generate_day_schedule(route, day_type) for day_type in DAY_TYPES
+                }
+        return individual
+
+    def _worker_state(self):
+        """Inputs a fitness worker keeps warm; raw trip requests stay here, the histogram goes"""
+        state = dict(self.__dict__)
+        state['trip_requests'] = []
+        return state
+
+    def _evaluate_parallel(self, executor, workers, population):
+        """_evaluate_population split into one chunk of genomes per worker"""
+        genomes = [self._genome(individual) for individual in population]
+        chunk_size = -(-len(genomes) // workers)
+        chunks = [genomes[start:start + chunk_size] for start in range(0, len(genomes), chunk_size)]
+
+        fitness = []
+        offset = 0
+        for chunk_fitness, chunk_metrics in executor.map(evaluate_genomes, chunks):
+            for metrics in chunk_metrics:
+                population[offset]['fitness_metrics'] = metrics
+                offset += 1
+            fitness.extend(chunk_fitness)
+        return fitness
+
+    def optimize(self, population_size=50, generations=30, mutation_rate=0.1, workers=None,
+                 progress=None, cancel_event=None):
+        """
+        Main optimization process. workers > 1 scores each generation in that
+        many processes; results are identical to the serial run for a given seed.
+        progress(generation, generations, best_fitness) is called after each
+        generation, and setting cancel_event stops the run with None.
+        """
         logging.info("Starting optimization process")
         
+        executor = None
         try:
             # Print out some debug information
             logging.info(f"Population Size: {population_size}")
@@ -312,6 +447,18 @@ class BusScheduleOptimizer:
             logging.info(f"Number of Routes: {len(self.current_schedules)}")
             logging.info(f"Current Fleet: {self.current_fleet}")
             logging.info(f"Number of Trip Requests: {len(self.trip_requests)}")
+            logging.info(f"Workers: {workers or 1}")
+
+            if workers and workers > 1:
+                # Spawned, not forked, since this runs inside a threaded web server.
+                # Workers re-import the main script as __mp_main__, which is why
+                # app.py starts its services in init_services and not at import
+                executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(BusScheduleOptimizer, self._worker_state())
+                )
             
             # Initialize population
             population = [self._create_individual() for _ in range(population_size)]
@@ -319,9 +466,12 @@ class BusScheduleOptimizer:
             best_fitness = float('-inf')
             
             for generation in range(generations):
-                # Evaluate fitness
-                fitness_scores = [(ind, self._calculate_fitness(ind)) 
-                                for ind in population]
+                # Evaluate fitness for the whole population at once
+                if executor:
+                    fitness = self._evaluate_parallel(executor, workers, population)
+                else:
+                    fitness = self._evaluate_population(population).tolist()
+                fitness_scores = list(zip(population, fitness))
                 fitness_scores.sort(key=lambda x: x[1], reverse=True)
                 
                 # Update best solution
@@ -347,6 +497,12 @@ class BusScheduleOptimizer:
                 
                 # Log progress
                 logging.info(f"Generation {generation}: Best fitness = {best_fitness}")
+                if progress:
+                    progress(generation + 1, generations, best_fitness)
+
+                if cancel_event is not None and cancel_event.is_set():
+                    logging.info(f"Optimization cancelled at generation {generation}")
+                    return None
                 
                 # Early stopping if good solution found
                 if best_fitness > 0.85:
@@ -355,7 +511,7 @@ class BusScheduleOptimizer:
 
             return {
                 'optimized_fleet': best_solution['fleet'],
-                'optimized_schedules': best_solution['schedules'],
+                'optimized_schedules': format_schedules(best_solution['schedules']),
                 'fitness_score': best_fitness,
                 'fitness_metrics': best_solution['fitness_metrics']
             }
@@ -364,60 +520,80 @@ class BusScheduleOptimizer:
             logging.error(f"Optimization error: {str(e)}")
             logging.error(traceback.format_exc())
             return None
-        
-def optimize_fleet_and_schedule(bus_data, trip_requests, current_fleet, population_size=50, generations=30, mutation_rate=0.1):
-    """Main function to optimize fleet and schedule"""
-    try:
-        # Prepare optimization data
-        optimization_data = {
-            'current_schedules': bus_data,
-            'demand_patterns': {
-                'hourly_demand': {},
-                'peak_hours': [],
-                'route_patterns': {}
-            },
-            'fleet_data': {
-                'current_fleet': current_fleet,
-                'total_capacity': sum(current_fleet.values())
-            },
-            'historical_data': {},
-            'trip_requests': trip_requests
+
+        finally:
+            if executor:
+                executor.shutdown()
+
+def format_schedules(schedules):
+    """Route -> bus -> day type schedules with minutes formatted as 'HH:MM' for JSON"""
+    return {
+        route: {
+            bus: {day_type: [format_minutes(minute) for minute in departures]
+                  for day_type, departures in bus_schedules.items()}
+            for bus, bus_schedules in buses.items()
         }
+        for route, buses in schedules.items()
+    }
 
-        # Process trip requests for demand patterns
-        hourly_demand = defaultdict(int)
-        route_patterns = defaultdict(lambda: defaultdict(int))
+def build_fleet_optimizer(bus_data, trip_requests, current_fleet):
+    """
+    Optimizer with demand patterns derived from trip_requests. Everything is
+    read from the requests here, so optimize() can run after the session closes.
+    """
+    # Prepare optimization data
+    optimization_data = {
+        'current_schedules': bus_data,
+        'demand_patterns': {
+            'hourly_demand': {},
+            'peak_hours': [],
+            'route_patterns': {}
+        },
+        'fleet_data': {
+            'current_fleet': current_fleet,
+            'total_capacity': sum(current_fleet.values())
+        },
+        'historical_data': {},
+        'trip_requests': trip_requests
+    }
 
-        for request in trip_requests:
-            hour = request.desired_time.hour
-            hourly_demand[hour] += 1
+    # Process trip requests for demand patterns
+    hourly_demand = defaultdict(int)
+    route_patterns = defaultdict(lambda: defaultdict(int))
+    stop_index = StopIndex(bus_data)
 
-            # Find relevant route for the request
-            for route_name, route_data in bus_data.items():
-                if request.starting_point in route_data['stops'] and request.destination in route_data['stops']:
-                    route_patterns[route_name][hour] += 1
-                    break
+    for request in trip_requests:
+        hour = request.desired_time.hour
+        hourly_demand[hour] += 1
 
-        # Calculate peak hours (hours with demand > 120% of average)
-        if hourly_demand:
-            avg_demand = sum(hourly_demand.values()) / len(hourly_demand)
-            peak_hours = [hour for hour, demand in hourly_demand.items() 
-                    if demand > avg_demand * 1.2]
-        else:
-            peak_hours = []
+        # Find relevant route for the request
+        routes = stop_index.common_routes(request.starting_point, request.destination)
+        if routes:
+            route_patterns[routes[0]][hour] += 1
+
+    # Calculate peak hours (hours with demand > 120% of average)
+    if hourly_demand:
+        avg_demand = sum(hourly_demand.values()) / len(hourly_demand)
+        peak_hours = [hour for hour, demand in hourly_demand.items() 
+                if demand > avg_demand * 1.2]
+    else:
+        peak_hours = []
 
-        # Update optimization data with processed patterns
-        optimization_data['demand_patterns'].update({
-            'hourly_demand': dict(hourly_demand),
-            'peak_hours': peak_hours,
-            'route_patterns': {k: dict(v) for k, v in route_patterns.items()}
-        })
+    # Update optimization data with processed patterns
+    optimization_data['demand_patterns'].update({
+        'hourly_demand': dict(hourly_demand),
+        'peak_hours': peak_hours,
+        'route_patterns': {k: dict(v) for k, v in route_patterns.items()}
+    })
 
-        # Create optimizer instance with prepared data
-        optimizer = BusScheduleOptimizer(optimization_data)
+    # Create optimizer instance with prepared data
+    return BusScheduleOptimizer(optimization_data)
 
-        # Run optimization
-        return optimizer.optimize(population_size, generations, mutation_rate)
+def optimize_fleet_and_schedule(bus_data, trip_requests, current_fleet, population_size=50, generations=30, mutation_rate=0.1, workers=None):
+    """Main function to optimize fleet and schedule"""
+    try:
+        optimizer = build_fleet_optimizer(bus_data, trip_requests, current_fleet)
+        return optimizer.optimize(population_size, generations, mutation_rate, workers)
 
     except Exception as e:
         logging.error(f"Error in optimize_fleet_and_schedule: {str(e)}")
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response, Response, stream_with_context
 from functools import wraps # To create decorators for authentication
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta, timezone, time
@@ -8,12 +8,22 @@ from gis_simulation import update_bus_locations, GISTracker
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import asc, func
 from flask_migrate import Migrate
-from genetic_algorithm import find_alternative_routes, calculate_alternative_route_times, optimize_user_travel
-from admin_optimizer import optimize_fleet_and_schedule, BusScheduleOptimizer
+from genetic_algorithm import optimize_user_travel
+from admin_optimizer import build_fleet_optimizer, BusScheduleOptimizer
+from timetable import DAY_TYPES, DAY_MINUTES, TimetableStore, to_minutes, format_minutes, format_day_minutes, route_segment
+from result_cache import ResultCache
+from write_behind import WriteBehindQueue
+from optimization_jobs import JobRunner
+from journey_planner import earliest_arrival, connection_scan, earliest_arrivals_from, latest_departures_to, format_journey
+from journey_planner import pareto_earliest_arrival, pareto_latest_departure, profile_scan, next_departures
+from journey_planner import direct_rides, direct_journey
 import traceback # For error handling
 import json
 import time # For time-related operations
 import traceback, logging
+import atexit
+import os
+import threading
 
 
 # Set up logging x
@@ -111,206 +121,144 @@ class Driver(db.Model):
     current_location_lng = db.Column(db.Float)
     last_location_update = db.Column(db.DateTime)
 
-with app.app_context():
-    db.create_all()
-
 # Add this new route
 @app.route('/update_bus_locations')
 def get_bus_locations():
-    bus_data = load_bus_data_from_db()
+    bus_data = timetable_store.get().bus_data
     updated_locations = update_bus_locations(bus_data)
     return json.dumps(updated_locations)
 
-def load_bus_data_from_db():
-    bus_data = {}
-    routes = Route.query.all()
-    for route in routes:
-        bus_data[route.name] = {
-            'stops': [stop.name for stop in route.stops],
-            'buses': {}
-        }
-        for bus in route.buses:
-            bus_data[route.name]['buses'][bus.name] = {
-                'weekdays': [],
-                'friday': [],
-                'weekends': []
-            }
-            for schedule in bus.schedules:
-                bus_data[route.name]['buses'][bus.name][schedule.day_type].append(
-                    schedule.departure_time.strftime('%H:%M')
-                )
-    return bus_data
+def check_schedule_availability(timetable, route_name, day_types):
+    """
+    Check the route runs on the travel day. Late-night and early-morning
+    times are still served from the rolling timetable, which includes the
+    previous day's late trips and the next day's early ones.
+    Returns: tuple (bool, str) - (is_available, message)
+    """
+    if not timetable.departures_for(route_name, day_types[1]):
+        return False, f"No buses available for this route on {day_types[1]}."
+    return True, ""
+
+# Add this function at the top of the file, with other helper functions
+# Number of ranked journey options offered to the rider
+ALTERNATIVE_OPTIONS = 3
+
+# Latest arrival-by plans may arrive this early, e.g. last night's bus for a 1 AM search
+MAX_EARLY_ARRIVAL_MINUTES = 6 * 60
 
+# Warn the rider when the suggested bus leaves this much after the desired time
+LATE_DEPARTURE_WARNING_MINUTES = 60
 
-def check_schedule_availability(bus_data, route_name, day_type, desired_time, start, dest):
+def departure_warning(departure_minutes, travel_datetime):
     """
-    Check if desired time is within available schedule times
-    Returns: tuple (bool, str, str) - (is_available, message, first_bus_time)
+    Notice for a suggested bus that leaves on another day than travel_datetime,
+    or more than LATE_DEPARTURE_WARNING_MINUTES after it; None otherwise
     """
-    # Get route stops and calculate travel time
-    route_stops = bus_data[route_name]['stops']
-    start_idx = route_stops.index(start)
-    end_idx = route_stops.index(dest)
-    
-    # Calculate travel time
-    if start_idx < end_idx:
-        num_stops = end_idx - start_idx
-    else:
-        num_stops = len(route_stops) - start_idx + end_idx
-    travel_time = timedelta(minutes=(num_stops * 3.5 + min(num_stops * 0.5, 10)))
-    
-    # Get all schedules for this route and day type
-    schedules = Schedule.query.join(Bus).join(Route).filter(
-        Route.name == route_name,
-        Schedule.day_type == day_type
-    ).order_by(Schedule.departure_time).all()
-    
-    if not schedules:
-        return False, f"No buses available for this route on {day_type}.", None
-    
-    # Get first and last bus times
-    first_bus = schedules[0].departure_time
-    last_bus = schedules[-1].departure_time
-    
-    first_departure = first_bus.strftime("%I:%M %p")
-    last_departure = last_bus.strftime("%I:%M %p")
-    
-    # Convert user's desired time for comparison
-    desired_time = desired_time.time()
-    
-    if desired_time > (datetime.combine(datetime.today(), last_bus) + travel_time).time():
-        return False, f"Your desired arrival time ({desired_time.strftime('%I:%M %p')}) is too late. Last bus departs at {last_departure}. First bus tomorrow is at {first_departure}.", first_bus
-        
-    if desired_time < (datetime.combine(datetime.today(), first_bus) + travel_time).time():
-        return False, f"Your desired arrival time is too early. First bus is at {first_departure}.", first_bus
-        
-    return True, "", first_bus
+    departure_text = format_minutes(departure_minutes, '%I:%M %p')
+    day_offset = int(departure_minutes // DAY_MINUTES)
+    if day_offset:
+        departure_date = travel_datetime.date() + timedelta(days=day_offset)
+        return f"The suggested bus leaves at {departure_text} on {departure_date.strftime('%A, %d %B')}, not on your travel date."
+
+    late_minutes = round(departure_minutes - to_minutes(travel_datetime))
+    if late_minutes > LATE_DEPARTURE_WARNING_MINUTES:
+        return (f"No bus gets you there by {travel_datetime.strftime('%I:%M %p')}. "
+                f"The suggested bus leaves at {departure_text}, {late_minutes // 60}h {late_minutes % 60:02d}m later.")
+    return None
+
+def choose_direct_trip(route, board_position, alight_position, desired_minutes):
+    """
+    Trip of one direct ride for reaching the alighting stop by desired_minutes:
+    the earliest arriving 5-15 minutes early, else the latest arriving in time
+    (at most MAX_EARLY_ARRIVAL_MINUTES early), else the first arriving after.
+    Across rides the earliest arrival wins within the first and last tiers.
+    Returns (rank, trip) where a lower rank is a better choice, or None.
+    """
+    trip = route.earliest_trip(alight_position, desired_minutes - 15)
+    if trip is not None and route.time_at(trip, alight_position) <= desired_minutes - 5:
+        return (0, route.time_at(trip, alight_position)), trip
 
-def calculate_travel_time(start_idx, end_idx, total_stops):
-    """Calculates optimized travel time between stops"""
-    # Calculate number of stops between start and end
-    if start_idx < end_idx:
-        num_stops = end_idx - start_idx
-    else:
-        num_stops = total_stops - start_idx + end_idx
-    
-    # Base time calculation: 3-4 minutes between stops with traffic consideration
-    base_time = num_stops * 3.5
-    
-    # Add buffer based on number of stops
-    buffer_time = min(num_stops * 0.8, 15)  # Maximum 15 minute buffer for long routes
-    
-    return timedelta(minutes=(base_time + buffer_time))
-
-def calculate_suggested_arrival(departure_time, buffer_minutes=10):
-    """Calculate when user should arrive at the starting point"""
-    return departure_time - timedelta(minutes=buffer_minutes)
-
-def find_closest_departure_time(departure_times, travel_datetime, route_stops, start, dest):
-    """Finds the optimal departure time to reach destination at desired time"""
-    closest_departure = None
-    min_wait_time = timedelta.max
-    start_idx = route_stops.index(start)
-    end_idx = route_stops.index(dest)
-    
-    # Calculate travel time for this route
-    travel_time = calculate_travel_time(start_idx, end_idx, len(route_stops))
-    boarding_buffer = timedelta(minutes=10)  # Add boarding buffer
-    total_journey_time = travel_time + boarding_buffer
-    
-    # Define ideal arrival window (5-15 minutes before desired time)
-    latest_arrival = travel_datetime - timedelta(minutes=5)
-    earliest_arrival = travel_datetime - timedelta(minutes=15)
-    
-    for dep_time in departure_times:
-        # Convert departure time string to datetime
-        dep_datetime = datetime.combine(
-            travel_datetime.date(), 
-            datetime.strptime(dep_time, "%H:%M").time()
+    trip = route.latest_trip(alight_position, desired_minutes)
+    if trip is not None and route.time_at(trip, alight_position) >= desired_minutes - MAX_EARLY_ARRIVAL_MINUTES:
+        return (1, -route.time_at(trip, alight_position)), trip
+
+    trip = route.earliest_trip(alight_position, desired_minutes)
+    if trip is not None:
+        return (2, route.time_at(trip, alight_position)), trip
+    return None
+
+def find_direct_journey(timetable, route_names, starting_point, destination, desired_minutes, day_types):
+    """
+    Best single-bus journey on one of route_names over the rolling timetable
+    for day_types, by the choose_direct_trip ranking, or None. Times follow
+    the planners' model (see CompiledTimetable), so / and /api/plan agree.
+    """
+    network = timetable.rolling_network(day_types)
+    best = None
+    for route, board_position, alight_position in direct_rides(network, starting_point, destination):
+        if route.name not in route_names:
+            continue
+        choice = choose_direct_trip(route, board_position, alight_position, desired_minutes)
+        if choice is not None and (best is None or choice[0] < best[0]):
+            best = (choice[0], direct_journey(route, choice[1], board_position, alight_position))
+    return best[1] if best else None
+
+def find_alternative_routes(timetable, starting_point, destination, travel_datetime, day_types, max_transfers=3, limit=ALTERNATIVE_OPTIONS):
+    """
+    Journeys with up to max_transfers changes that reach the destination by
+    travel_datetime, using real departures at each transfer stop. Ranked best
+    first from the Pareto set over (departure, transfers, transfer waiting
+    time). Searches the rolling timetable for day_types (previous, travel,
+    next day), so late trips of the day before count; whole journeys must
+    fit in the MAX_EARLY_ARRIVAL_MINUTES before the desired time, which also
+    rules out overnight waits at a transfer stop. If nothing arrives in time,
+    fall back to the earliest journeys after the desired time.
+    """
+    network = timetable.rolling_network(day_types)
+    desired_minutes = to_minutes(travel_datetime)
+    earliest_departure = desired_minutes - MAX_EARLY_ARRIVAL_MINUTES
+
+    journeys = [
+        journey for journey in pareto_latest_departure(
+            network, starting_point, destination, desired_minutes, max_transfers,
+            window=MAX_EARLY_ARRIVAL_MINUTES
         )
-        
-        # Calculate arrival time for this departure
-        arrival_time = dep_datetime + total_journey_time
-        
-        # Check if arrival is within our ideal window
-        if earliest_arrival <= arrival_time <= latest_arrival:
-            wait_time = travel_datetime - arrival_time
-            if abs(wait_time - timedelta(minutes=10)) < min_wait_time:
-                min_wait_time = abs(wait_time - timedelta(minutes=10))
-                closest_departure = dep_time
-    
-    # If no ideal time found, look for any departure that gets us there before desired time
-    if not closest_departure:
-        latest_possible = None
-        min_difference = timedelta.max
-        
-        for dep_time in departure_times:
-            dep_datetime = datetime.combine(
-                travel_datetime.date(), 
-                datetime.strptime(dep_time, "%H:%M").time()
+        if journey['departure'] >= earliest_departure
+    ][:limit]
+    if not journeys:
+        # Nothing arrives inside the early-arrival window, so these all arrive after the desired time
+        first = earliest_arrival(network, starting_point, destination, earliest_departure, max_transfers)
+        if first:
+            journeys = pareto_earliest_arrival(
+                network, starting_point, destination, min(j['departure'] for j in first),
+                max_transfers, window=None, limit=limit
             )
-            arrival_time = dep_datetime + total_journey_time
-            
-            if arrival_time <= travel_datetime:
-                difference = travel_datetime - arrival_time
-                if difference < min_difference:
-                    min_difference = difference
-                    latest_possible = dep_time
-        
-        closest_departure = latest_possible
-    
-    return closest_departure
 
-# Add this function at the top of the file, with other helper functions
-def find_alternative_routes(bus_data, starting_point, destination, max_transfers=3):
     routes = []
-    for route1, data1 in bus_data.items():
-        for route2, data2 in bus_data.items():
-            if route1 != route2:
-                # Find common stops between routes
-                stops1 = set(data1['stops'])
-                stops2 = set(data2['stops'])
-                transfer_stops = stops1.intersection(stops2)
-                
-                for transfer_stop in transfer_stops:
-                    if starting_point in data1['stops'] and transfer_stop in data1['stops'] and \
-                       transfer_stop in data2['stops'] and destination in data2['stops']:
-                        # Calculate segments
-                        first_route_stops = data1['stops']
-                        second_route_stops = data2['stops']
-                        
-                        start_idx1 = first_route_stops.index(starting_point)
-                        transfer_idx1 = first_route_stops.index(transfer_stop)
-                        transfer_idx2 = second_route_stops.index(transfer_stop)
-                        dest_idx2 = second_route_stops.index(destination)
-                        
-                        # Get all stops for first leg
-                        if start_idx1 <= transfer_idx1:
-                            first_leg_stops = first_route_stops[start_idx1:transfer_idx1 + 1]
-                        else:
-                            first_leg_stops = first_route_stops[start_idx1:] + first_route_stops[:transfer_idx1 + 1]
-                        
-                        # Get all stops for second leg
-                        if transfer_idx2 <= dest_idx2:
-                            second_leg_stops = second_route_stops[transfer_idx2:dest_idx2 + 1]
-                        else:
-                            second_leg_stops = second_route_stops[transfer_idx2:] + second_route_stops[:dest_idx2 + 1]
-                        
-                        # Calculate travel times
-                        first_leg_time = (len(first_leg_stops) - 1) * 5  # 5 minutes between stops
-                        second_leg_time = (len(second_leg_stops) - 1) * 5
-                        transfer_time = 10  # 10 minutes for transfer
-                        
-                        routes.append({
-                            'first_route': route1,
-                            'second_route': route2,
-                            'transfer_stop': transfer_stop,
-                            'first_leg_stops': first_leg_stops,
-                            'second_leg_stops': second_leg_stops,
-                            'first_leg_time': first_leg_time,
-                            'second_leg_time': second_leg_time,
-                            'total_time': first_leg_time + second_leg_time + transfer_time
-                        })
+    for journey in journeys:
+        legs = format_journey(journey, day_labels=True)['legs']
+        raw_legs = journey['legs']
+        for leg, raw_leg, next_leg in zip(legs, raw_legs, raw_legs[1:] + [None]):
+            leg['travel_time'] = round(raw_leg['arrival'] - raw_leg['departure'])
+            if next_leg:
+                leg['wait_time'] = round(next_leg['departure'] - raw_leg['arrival'])
+
+        first_leg, last_leg = legs[0], legs[-1]
+        routes.append({
+            'first_route': first_leg['route'],
+            'second_route': last_leg['route'],
+            'transfer_stop': first_leg['alight_stop'],
+            'first_leg_stops': first_leg['stops'],
+            'second_leg_stops': last_leg['stops'],
+            'first_leg_time': first_leg['travel_time'],
+            'second_leg_time': last_leg['travel_time'],
+            'total_time': round(journey['arrival'] - journey['departure']),
+            'transfers': journey['transfers'],
+            'wait_time': round(journey['wait']),
+            'departure': journey['departure'],
+            'arrival': journey['arrival'],
+            'legs': legs
+        })
     
     return routes
 
@@ -324,247 +272,50 @@ def home():
             destination = request.form['destination'].strip()
 
             travel_datetime = datetime.combine(travel_date, desired_time)
-            desired_arrival = datetime.combine(travel_date, desired_time)
 
-            bus_data = load_bus_data_from_db()
-            logger.debug(f"Bus data: {bus_data}")
+            timetable = timetable_store.get()
+            logger.debug(f"Using timetable version {timetable.version}")
 
-            all_stops = Stop.query.all()
-            stop_names = [stop.name.strip().lower() for stop in all_stops]
+            # Case-insensitive match against the compiled stop names
+            resolved_start = timetable.stop_names.resolve(starting_point)
+            resolved_destination = timetable.stop_names.resolve(destination)
 
-            if starting_point.lower() not in stop_names:
+            if resolved_start is None:
                 flash(f"Starting point '{starting_point}' not found. Please choose from the provided options.", "error")
                 return redirect(url_for('home'))
-            if destination.lower() not in stop_names:
+            if resolved_destination is None:
                 flash(f"Destination '{destination}' not found. Please choose from the provided options.", "error")
                 return redirect(url_for('home'))
+            starting_point, destination = resolved_start, resolved_destination
 
-            # Determine day type
-            day_of_week = travel_datetime.strftime('%A').lower()
-            if day_of_week == 'friday':
-                day_type = 'friday'
-            elif day_of_week in ['saturday', 'sunday']:
-                day_type = 'weekends'
-            else:
-                day_type = 'weekdays'
-
-            # Find the relevant route
-            relevant_route = None
-            for route_name, route_data in bus_data.items():
-                if starting_point in route_data['stops'] and destination in route_data['stops']:
-                    relevant_route = route_name
-                    break
-
-            if relevant_route:
-                # Direct route found - check schedule availability first
-                is_available, message, first_bus = check_schedule_availability(
-                    bus_data, 
-                    relevant_route, 
-                    day_type, 
-                    travel_datetime,
-                    starting_point,
-                    destination
-                )
-                
-                if not is_available:
-                    flash(message, "error")
-                    return redirect(url_for('home'))
-
-                # Available buses check
-                available_buses = []
-                if relevant_route in bus_data:
-                    for bus, schedules in bus_data[relevant_route]['buses'].items():
-                        if day_type in schedules and schedules[day_type]:
-                            available_buses.append(bus)
-
-                if not available_buses:
-                    flash(f"No buses are available for this route on {day_of_week.capitalize()}s.", "warning")
-                    return redirect(url_for('home'))
-
-                # Get route stops and calculate optimal travel time
-                route_stops = bus_data[relevant_route]['stops']
-                start_index = route_stops.index(starting_point)
-                end_index = route_stops.index(destination)
-                travel_time = calculate_travel_time(start_index, end_index, len(route_stops))
-
-                # Get all departure times for this route
-                all_departure_times = []
-                for bus in available_buses:
-                    if relevant_route in bus_data:
-                        schedules = bus_data[relevant_route]['buses'][bus]
-                        if day_type in schedules:
-                            for departure_time in schedules[day_type]:
-                                departure_datetime = datetime.combine(
-                                    travel_date,
-                                    datetime.strptime(departure_time, '%H:%M').time()
-                                )
-                                # Calculate travel time and estimated arrival
-                                travel_time = calculate_travel_time(
-                                    route_stops.index(starting_point),
-                                    route_stops.index(destination),
-                                    len(route_stops)
-                                )
-                                estimated_arrival = departure_datetime + travel_time + timedelta(minutes=10)
-                                
-                                # Only consider departures that get us there before or at desired time
-                                if estimated_arrival <= desired_arrival:
-                                    all_departure_times.append((bus, departure_time, estimated_arrival))
-
-                    if not all_departure_times:
-                        flash("No departures found that arrive before your desired time. Please try a later arrival time.", "warning")
-                        return redirect(url_for('home'))
-
-                # Sort by arrival time to find optimal departure
-                all_departure_times.sort(key=lambda x: x[2])
-                
-                # Find the best departure time (arriving 5-15 minutes before desired time)
-                suitable_departure = None
-                suitable_bus = None
-                final_arrival = None
+            # Day types of the previous, travel and next day for the rolling timetable
+            day_types = day_types_around(travel_date)
 
-                
-                for bus, dep_time, arr_time in all_departure_times:
-                    wait_time = desired_arrival - arr_time
-                    if timedelta(minutes=5) <= wait_time <= timedelta(minutes=15):
-                        suitable_bus = bus
-                        suitable_departure = datetime.strptime(dep_time, '%H:%M').time()
-                        final_arrival = arr_time
-                        break
-
-                # If no ideal time found, take the latest possible departure that gets us there before desired time
-                if suitable_departure is None and all_departure_times:
-                    suitable_bus = all_departure_times[-1][0]
-                    suitable_departure = datetime.strptime(all_departure_times[-1][1], '%H:%M').time()
-                    final_arrival = all_departure_times[-1][2]
-
-                if suitable_departure is None:
-                    flash("No suitable bus departures found. Please try a different time or route.", "error")
-                    return redirect(url_for('home'))
-
-                # Calculate suggested arrival time (10 minutes before departure)
-                suggested_arrival = (datetime.combine(travel_date, suitable_departure) - 
-                        timedelta(minutes=10))
-                suggested_arrival_str = suggested_arrival.strftime('%I:%M %p')
-
-                # Get ordered route stops
-                route_stops = get_route_stops(relevant_route, starting_point, destination)
-
-                # Record trip request
-                trip_request = TripRequest(
-                    desired_time=travel_datetime,
-                    starting_point=starting_point,
-                    destination=destination
-                )
-                db.session.add(trip_request)
-                db.session.commit()
+            # Identical searches against the same timetable version are served from the cache;
+            # the date is part of the key because messages name the travel day
+            cache_key = (
+                'home', starting_point, destination, travel_date,
+                journey_cache.time_bucket(desired_time), timetable.version
+            )
+            result = journey_cache.get(cache_key)
+            if result is None:
+                result = plan_home_trip(timetable, starting_point, destination, travel_datetime, day_types)
+                journey_cache.put(cache_key, result)
+
+            message, category, context = result
+            if message:
+                flash(message, category)
+                return redirect(url_for('home'))
 
-                return render_template('user_result.html',
-                                    arrival_time=desired_arrival.strftime('%I:%M %p'),
-                                    starting_point=starting_point,
-                                    destination=destination,
-                                    bus_group=relevant_route,
-                                    bus_name=suitable_bus,
-                                    optimized_plan=[suitable_departure.strftime('%I:%M %p')],
-                                    actual_arrival=final_arrival.strftime('%I:%M %p'),
-                                    route_stops=route_stops,
-                                    is_alternative=False,
-                                    suggested_arrival=suggested_arrival_str)
+            # Record trip request; written in batches off the request path
+            trip_request_log.put({
+                'desired_time': travel_datetime,
+                'starting_point': starting_point,
+                'destination': destination,
+                'created_at': datetime.now(timezone.utc)
+            })
 
-            else:
-                # Look for alternative routes
-                alternative_routes = find_alternative_routes(bus_data, starting_point, destination)
-                
-                if not alternative_routes:
-                    flash("No direct or alternative routes found between these stops.", "error")
-                    return redirect(url_for('home'))
-                
-                # Find best alternative route (shortest total time)
-                best_alternative = min(alternative_routes, key=lambda x: x['total_time'])
-                
-                # Calculate departure and arrival times for first leg
-                first_route = best_alternative['first_route']
-                
-                # Calculate day type
-                day_type = 'weekdays'
-                if day_of_week == 'friday':
-                    day_type = 'friday'
-                elif day_of_week in ['saturday', 'sunday']:
-                    day_type = 'weekends'
-                
-                # Find available buses and departure times for first route
-                first_route_buses = bus_data[first_route]['buses']
-                available_departures = []
-                
-                for bus, schedules in first_route_buses.items():
-                    if day_type in schedules and schedules[day_type]:
-                        for departure_time in schedules[day_type]:
-                            departure_datetime = datetime.combine(
-                                travel_date,
-                                datetime.strptime(departure_time, '%H:%M').time()
-                            )
-                            estimated_arrival = departure_datetime + timedelta(minutes=best_alternative['first_leg_time'])
-                            if estimated_arrival <= desired_arrival:
-                                available_departures.append((bus, departure_datetime, estimated_arrival))
-                
-                # If no departures found, get the earliest departure
-                if not available_departures:
-                    earliest_time = None
-                    earliest_bus = None
-                    
-                    for bus, schedules in first_route_buses.items():
-                        if day_type in schedules and schedules[day_type]:
-                            for departure_time in schedules[day_type]:
-                                time_obj = datetime.strptime(departure_time, '%H:%M').time()
-                                if earliest_time is None or time_obj < earliest_time:
-                                    earliest_time = time_obj
-                                    earliest_bus = bus
-                    
-                    if earliest_time:
-                        departure_datetime = datetime.combine(travel_date, earliest_time)
-                        estimated_arrival = departure_datetime + timedelta(minutes=best_alternative['first_leg_time'])
-                        available_departures.append((earliest_bus, departure_datetime, estimated_arrival))
-                
-                # If still no departures, handle no routes scenario
-                if not available_departures:
-                    flash("No suitable alternative routes found for your desired arrival time.", "error")
-                    return redirect(url_for('home'))
-                
-                # Sort departures and get the best one
-                available_departures.sort(key=lambda x: x[2])
-                best_departure = available_departures[-1]
-                
-                # Calculate suggested arrival time
-                suggested_arrival = best_departure[1] - timedelta(minutes=10)
-                suggested_arrival_str = suggested_arrival.strftime('%I:%M %p')
-                
-                # Update best_alternative with timing information
-                best_alternative.update({
-                    'first_bus': best_departure[0],
-                    'first_departure': best_departure[1].strftime('%I:%M %p'),
-                    'transfer_time': (best_departure[2] + timedelta(minutes=10)).strftime('%I:%M %p')
-                })
-                
-                # Record trip request
-                trip_request = TripRequest(
-                    desired_time=travel_datetime,
-                    starting_point=starting_point,
-                    destination=destination
-                )
-                db.session.add(trip_request)
-                db.session.commit()
-                
-                # Return alternative route result
-                return render_template(
-                    'user_result.html',
-                    arrival_time=desired_arrival.strftime('%I:%M %p'),
-                    starting_point=starting_point,
-                    destination=destination,
-                    alternative_route=best_alternative,
-                    is_alternative=True,
-                    optimized_plan=[''],
-                    actual_arrival='',
-                    suggested_arrival=suggested_arrival_str
-                )
+            return render_template('user_result.html', **context)
 
         except Exception as e:
             print(f"An error occurred: {str(e)}")
@@ -572,11 +323,93 @@ def home():
             flash(f"An error occurred while processing your request: {str(e)}", "error")
             return redirect(url_for('home'))
 
-    # GET request handling
+    # GET request handling; stop names are fetched from /api/stops/suggest as the user types
     routes = Route.query.all()
-    all_stops = Stop.query.all()
-    stops = sorted(list(set([stop.name.strip() for stop in all_stops])))
-    return render_template('index.html', routes=routes, stops=stops)
+    return render_template('index.html', routes=routes)
+
+def plan_home_trip(timetable, starting_point, destination, travel_datetime, day_types):
+    """
+    Plan the trip shown on the home page over the rolling timetable for
+    day_types. Returns (message, category, None) when there is nothing to
+    show, else (None, None, user_result.html context).
+    """
+    desired_arrival = travel_datetime
+
+    # Direct routes, keeping those that run on the travel day
+    direct_routes = timetable.stop_index.common_routes(starting_point, destination)
+    running_routes = [
+        route_name for route_name in direct_routes
+        if check_schedule_availability(timetable, route_name, day_types)[0]
+    ]
+
+    direct = None
+    if direct_routes:
+        if not running_routes:
+            return check_schedule_availability(timetable, direct_routes[0], day_types)[1], "error", None
+
+        # Best trip over every running route, not just the first one listed
+        direct = find_direct_journey(
+            timetable, running_routes, starting_point, destination,
+            to_minutes(desired_arrival), day_types
+        )
+
+    if direct:
+        leg = direct['legs'][0]
+        departure_minutes = direct['departure']
+
+        # Calculate suggested arrival time (10 minutes before departure)
+        suggested_arrival_str = format_day_minutes(departure_minutes - 10, '%I:%M %p')
+
+        return None, None, dict(
+            arrival_time=desired_arrival.strftime('%I:%M %p'),
+            starting_point=starting_point,
+            destination=destination,
+            bus_group=leg['route'],
+            bus_name=leg['bus'],
+            optimized_plan=[format_day_minutes(departure_minutes, '%I:%M %p')],
+            actual_arrival=format_day_minutes(direct['arrival'], '%I:%M %p'),
+            route_stops=leg['stops'],
+            is_alternative=False,
+            suggested_arrival=suggested_arrival_str,
+            warning=departure_warning(departure_minutes, travel_datetime)
+        )
+
+    else:
+        # Look for alternative routes
+        alternative_routes = find_alternative_routes(
+            timetable, starting_point, destination, travel_datetime, day_types
+        )
+        
+        if not alternative_routes:
+            return "No direct or alternative routes found between these stops.", "error", None
+        
+        # Already ranked: latest departure, then fewer transfers, then less waiting
+        best_alternative = alternative_routes[0]
+        first_leg = best_alternative['legs'][0]
+        
+        # Calculate suggested arrival time
+        suggested_arrival_str = format_day_minutes(best_alternative['departure'] - 10, '%I:%M %p')
+        
+        # Update best_alternative with timing information
+        best_alternative.update({
+            'first_bus': first_leg['bus'],
+            'first_departure': first_leg['departure'],
+            'transfer_time': first_leg['arrival']
+        })
+        
+        # Return alternative route result
+        return None, None, dict(
+            arrival_time=desired_arrival.strftime('%I:%M %p'),
+            starting_point=starting_point,
+            destination=destination,
+            alternative_route=best_alternative,
+            other_alternatives=alternative_routes[1:],
+            is_alternative=True,
+            optimized_plan=[''],
+            actual_arrival='',
+            suggested_arrival=suggested_arrival_str,
+            warning=departure_warning(best_alternative['departure'], travel_datetime)
+        )
 
 def get_route_stops(route_name, start_stop=None, end_stop=None):
     route = Route.query.filter_by(name=route_name).first()
@@ -592,9 +425,8 @@ def get_route_stops(route_name, start_stop=None, end_stop=None):
         return stop_names
 
     try:
-        # Locate the indices of the starting point and destination in the list
-        start_index = stop_names.index(start_stop.strip())
-        end_index = stop_names.index(end_stop.strip())
+        # Locate the closest pair of visits to the starting point and destination
+        start_index, end_index = route_segment(stop_names, start_stop.strip(), end_stop.strip())
     except ValueError:
         return []  # Return empty list if start or end stop not found
     
@@ -1007,6 +839,7 @@ def create_route():
             db.session.add(bus)
 
         db.session.commit()
+        timetable_store.invalidate()
         return jsonify({'message': 'Route created successfully'}), 201
     except Exception as e:
         db.session.rollback()
@@ -1043,6 +876,7 @@ def update_route(route_id):
                 db.session.add(bus)
 
         db.session.commit()
+        timetable_store.invalidate()
         return jsonify({'message': 'Route updated successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1056,6 +890,7 @@ def delete_route(route_id):
         route = Route.query.get_or_404(route_id)
         db.session.delete(route)
         db.session.commit()
+        timetable_store.invalidate()
         return jsonify({'message': 'Route deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -1158,6 +993,7 @@ def schedules_management(route_id=None, bus_id=None):
                     )
                     db.session.add(new_schedule)
                     db.session.commit()
+                    timetable_store.invalidate()
                     
                     return jsonify({
                         'status': 'success',
@@ -1207,6 +1043,7 @@ def schedules_management(route_id=None, bus_id=None):
                 schedule.departure_time = time_obj
                 schedule.day_type = new_day_type
                 db.session.commit()
+                timetable_store.invalidate()
 
                 return jsonify({
                     'status': 'success',
@@ -1254,6 +1091,7 @@ def schedules_management(route_id=None, bus_id=None):
 
                 db.session.delete(schedule)
                 db.session.commit()
+                timetable_store.invalidate()
                 
                 return jsonify({
                     'status': 'success',
@@ -1523,45 +1361,83 @@ def get_system_status():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
+def optimizer_workers(value):
+    """Opt-in fitness worker processes for the fleet optimizer, capped at the CPU count"""
+    workers = int(value or 0)
+    return min(workers, os.cpu_count() or 1) if workers > 1 else None
+
+def optimization_job(optimizer, optimization_type, parameters, workers, extra=None):
+    """
+    Job body for optimization_jobs: runs the optimizer with the job's progress
+    and cancel hooks, then saves the result as an OptimizationResult.
+    """
+    def run(job):
+        result = optimizer.optimize(
+            population_size=parameters['population_size'],
+            generations=parameters['generations'],
+            mutation_rate=parameters['mutation_rate'],
+            workers=workers,
+            progress=job.report,
+            cancel_event=job.cancel_event
+        )
+        if result is None:
+            return None
+        if extra:
+            result = dict(result, **extra)
+
+        with app.app_context():
+            optimization_record = OptimizationResult(
+                optimization_type=optimization_type,
+                parameters=parameters,
+                results=result,
+                fitness_score=result['fitness_score']
+            )
+            db.session.add(optimization_record)
+            db.session.commit()
+            result['optimization_id'] = optimization_record.id
+        return result
+    return run
+
+def job_response(job):
+    """202 reply for a queued optimization job, pointing at its status endpoint"""
+    return jsonify({
+        'status': 'success',
+        'job_id': job.id,
+        'job': job.to_dict(include_result=False),
+        'status_url': url_for('get_optimization_job', job_id=job.id),
+        'cancel_url': url_for('cancel_optimization_job', job_id=job.id)
+    }), 202
+
 def collect_optimization_data():
     """Collect all necessary data for optimization"""
     try:
-        # 1. Current Bus Schedules
-        current_schedules = {}
-        routes = Route.query.all()
-        for route in routes:
-            current_schedules[route.name] = {
-                'buses': {},
-                'stops': [stop.name for stop in route.stops]
-            }
-            for bus in route.buses:
-                current_schedules[route.name]['buses'][bus.name] = {
-                    'weekdays': [],
-                    'friday': [],
-                    'weekends': []
-                }
-                for schedule in bus.schedules:
-                    current_schedules[route.name]['buses'][bus.name][schedule.day_type].append(
-                        schedule.departure_time.strftime('%H:%M')
-                    )
+        # 1. Current Bus Schedules, stops in route order
+        current_schedules = load_bus_data_from_db()
 
         # 2. Passenger Demand Trends
         demand_patterns = analyze_demand_patterns()
 
         # 3. Bus Capacity and Fleet
         fleet_data = {
-            'current_fleet': {route.name: len(route.buses) for route in routes},
-            'total_capacity': sum(len(route.buses) for route in routes)
+            'current_fleet': {name: len(route['buses']) for name, route in current_schedules.items()},
+            'total_capacity': sum(len(route['buses']) for route in current_schedules.values())
         }
 
         # 4. Historical Travel Patterns
         historical_data = analyze_historical_patterns()
 
+        # 5. Recent trip requests, scored against candidate schedules
+        thirty_days_ago = datetime.now() - timedelta(days=30)
+        trip_requests = TripRequest.query.filter(
+            TripRequest.created_at >= thirty_days_ago
+        ).all()
+
         return {
             'current_schedules': current_schedules,
             'demand_patterns': demand_patterns,
             'fleet_data': fleet_data,
-            'historical_data': historical_data
+            'historical_data': historical_data,
+            'trip_requests': trip_requests
         }
     except Exception as e:
         logging.error(f"Error collecting optimization data: {str(e)}")
@@ -1681,6 +1557,7 @@ def optimize_system():
         population_size = int(request.form.get('population_size', 50))
         generations = int(request.form.get('generations', 30))
         mutation_rate = float(request.form.get('mutation_rate', 0.1))
+        workers = optimizer_workers(request.form.get('workers'))
 
         # Collect optimization data
         optimization_data = collect_optimization_data()
@@ -1691,49 +1568,29 @@ def optimize_system():
                 'message': 'No current schedules found. Please set up routes and schedules first.'
             }), 400
 
-        # Initialize optimizer with collected data
+        # Initialize optimizer with collected data; it reads the trip requests
+        # up front, so the run itself can continue after this request ends
         optimizer = BusScheduleOptimizer(optimization_data)
-        
-        # Run optimization
-        result = optimizer.optimize(
-            population_size=population_size,
-            generations=generations,
-            mutation_rate=mutation_rate
+        parameters = {
+            'population_size': population_size,
+            'generations': generations,
+            'mutation_rate': mutation_rate
+        }
+        job = optimization_jobs.submit(
+            'fleet_schedule', parameters,
+            optimization_job(optimizer, 'fleet_schedule', parameters, workers)
         )
 
-        if not result:
-            return jsonify({
-                'status': 'error',
-                'message': 'Optimization failed to produce valid results'
-            }), 500
-
-        # Save optimization result
-        optimization_record = OptimizationResult(
-            optimization_type='fleet_schedule',
-            parameters={
-                'population_size': population_size,
-                'generations': generations,
-                'mutation_rate': mutation_rate
-            },
-            results=result,
-            fitness_score=result['fitness_score']
-        )
-        db.session.add(optimization_record)
-        
         # Create audit log
         audit_log = AuditLog(
             admin_id=session.get('admin_id'),
-            action="Ran schedule optimization",
+            action=f"Started schedule optimization job {job.id}",
             ip_address=request.remote_addr
         )
         db.session.add(audit_log)
-        
         db.session.commit()
 
-        return jsonify({
-            'status': 'success',
-            'result': result
-        })
+        return job_response(job)
 
     except ValueError as e:
         return jsonify({
@@ -1756,12 +1613,33 @@ def optimize_travel():
         travel_datetime = datetime.strptime(data['travel_datetime'], '%Y-%m-%d %H:%M')
         starting_point = data['starting_point']
         destination = data['destination']
+        # 'exact' enumerates departures; 'genetic' keeps the GA for experiments
+        method = data.get('method', 'exact')
+        if method not in ('exact', 'genetic'):
+            return jsonify({
+                'status': 'error',
+                'message': "method must be 'exact' or 'genetic'"
+            }), 400
 
         # Load bus data
-        bus_data = load_bus_data_from_db()
+        timetable = timetable_store.get()
+        day_type = get_day_type(travel_datetime.strftime('%A').lower())
+
+        # Only the deterministic solver is cached; GA runs are meant to vary
+        cache_key = (
+            'optimize_travel', starting_point, destination, day_type,
+            journey_cache.time_bucket(travel_datetime), timetable.version
+        )
+        result = journey_cache.get(cache_key) if method == 'exact' else None
 
         # Run optimization
-        result = optimize_user_travel(bus_data, travel_datetime, starting_point, destination)
+        if result is None:
+            result = optimize_user_travel(
+                timetable.bus_data, travel_datetime, starting_point, destination,
+                timetable=timetable, method=method
+            )
+            if method == 'exact' and result:
+                journey_cache.put(cache_key, result)
 
         if result:
             return jsonify({
@@ -1782,6 +1660,297 @@ def optimize_travel():
         }), 500
 
 
+@app.route('/api/result_cache/stats', methods=['GET'])
+@admin_required
+def get_result_cache_stats():
+    """Hit ratio and eviction counters of the journey result cache"""
+    return jsonify({
+        'status': 'success',
+        'timetable_version': timetable_store.version,
+        'stats': journey_cache.stats(),
+        'profile_stats': profile_cache.stats(),
+        'board_stats': board_cache.stats()
+    })
+
+@app.route('/api/trip_request_log/stats', methods=['GET'])
+@admin_required
+def get_trip_request_log_stats():
+    """Depth, dropped and written counters of the TripRequest write-behind queue"""
+    return jsonify({
+        'status': 'success',
+        'stats': trip_request_log.stats()
+    })
+
+
+MAX_STOP_SUGGESTIONS = 50
+
+@app.route('/api/stops/suggest', methods=['GET'])
+def suggest_stops():
+    """Stop names matching q at the start of the name or of any word in it"""
+    try:
+        query = request.args.get('q', '')
+        limit = min(int(request.args.get('limit', 10)), MAX_STOP_SUGGESTIONS)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid parameters: {str(e)}'
+        }), 400
+
+    try:
+        timetable = timetable_store.get()
+        return jsonify({
+            'status': 'success',
+            'suggestions': timetable.stop_names.suggest(query, max(limit, 0))
+        })
+
+    except Exception as e:
+        logging.error(f"Error suggesting stops: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+MAX_BOARD_DEPARTURES = 50
+
+@app.route('/api/stops/<name>/departures', methods=['GET'])
+def stop_departures(name):
+    """Departure board: the next n departures at a stop across all routes"""
+    try:
+        count = min(int(request.args.get('n', 10)), MAX_BOARD_DEPARTURES)
+        at = request.args.get('at')
+        board_datetime = datetime.strptime(at, '%Y-%m-%d %H:%M') if at else datetime.now()
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid parameters: {str(e)}'
+        }), 400
+
+    try:
+        timetable = timetable_store.get()
+        stop = timetable.stop_names.resolve(name)
+        if stop is None:
+            return jsonify({
+                'status': 'error',
+                'message': f"Stop '{name}' not found"
+            }), 404
+
+        board_minute = to_minutes(board_datetime)
+        cache_key = (stop, board_datetime.date(), board_minute, count, timetable.version)
+        board = board_cache.get(cache_key)
+        if board is None:
+            # Rolling network, so a late board shows tomorrow's first buses
+            network = timetable.rolling_network(day_types_around(board_datetime.date()))
+            board = {
+                'status': 'success',
+                'stop': ' '.join(stop.split()),
+                'time': board_datetime.strftime('%Y-%m-%d %H:%M'),
+                'departures': [
+                    {
+                        **departure,
+                        'departure': format_minutes(departure['departure']),
+                        'departure_day': int(departure['departure'] // DAY_MINUTES),
+                        'minutes_away': int(departure['departure'] - board_minute)
+                    }
+                    for departure in next_departures(network, stop, board_minute, max(count, 0))
+                ]
+            }
+            board_cache.put(cache_key, board)
+
+        # Identical until the minute changes, so screens and proxies may reuse it until then
+        response = make_response(jsonify(board))
+        response.headers['Cache-Control'] = f'public, max-age={60 - board_datetime.second}'
+        return response
+
+    except Exception as e:
+        logging.error(f"Error building departure board: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+def resolve_trip_stops(timetable, starting_point, destination):
+    """
+    bus_data spellings of a trip's stops, matched case- and whitespace-
+    insensitively as on the home form. Returns (start, destination, None),
+    or (None, None, message) naming the stop that was not found.
+    """
+    resolved_start = timetable.stop_names.resolve(starting_point)
+    if resolved_start is None:
+        return None, None, f"Starting point '{starting_point}' not found"
+    resolved_destination = timetable.stop_names.resolve(destination)
+    if resolved_destination is None:
+        return None, None, f"Destination '{destination}' not found"
+    return resolved_start, resolved_destination, None
+
+@app.route('/api/plan', methods=['GET'])
+def plan_journey():
+    """Leave after travel_datetime, arrive as early as possible (connection scan)"""
+    try:
+        travel_datetime = datetime.strptime(request.args['travel_datetime'], '%Y-%m-%d %H:%M')
+        starting_point = request.args['starting_point'].strip()
+        destination = request.args['destination'].strip()
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid parameters: {str(e)}'
+        }), 400
+
+    try:
+        timetable = timetable_store.get()
+        starting_point, destination, message = resolve_trip_stops(timetable, starting_point, destination)
+        if message:
+            return jsonify({'status': 'error', 'message': message}), 404
+
+        day_types = day_types_around(travel_datetime.date())
+        day_type = day_types[1]
+
+        # Rolling connections, so a late search can catch tomorrow's first buses
+        journey = connection_scan(
+            timetable.rolling_connections(day_types),
+            starting_point,
+            destination,
+            to_minutes(travel_datetime)
+        )
+
+        if not journey:
+            return jsonify({
+                'status': 'error',
+                'message': 'No suitable route found'
+            }), 404
+
+        return jsonify({
+            'status': 'success',
+            'day_type': day_type,
+            'journey': format_journey(journey, '%H:%M')
+        })
+
+    except Exception as e:
+        logging.error(f"Error in journey planning: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/plan/profile', methods=['GET'])
+def plan_profile():
+    """Every Pareto-optimal (departure, arrival) journey between two stops over a service day"""
+    try:
+        starting_point = request.args['starting_point'].strip()
+        destination = request.args['destination'].strip()
+        day_type = request.args.get('day_type')
+        if day_type is None:
+            travel_date = datetime.strptime(request.args['date'], '%Y-%m-%d') if 'date' in request.args else datetime.now()
+            day_type = get_day_type(travel_date.strftime('%A').lower())
+        elif day_type not in DAY_TYPES:
+            raise ValueError(f"day_type must be one of {', '.join(DAY_TYPES)}")
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid parameters: {str(e)}'
+        }), 400
+
+    try:
+        timetable = timetable_store.get()
+        starting_point, destination, message = resolve_trip_stops(timetable, starting_point, destination)
+        if message:
+            return jsonify({'status': 'error', 'message': message}), 404
+
+        cache_key = (starting_point, destination, day_type, timetable.version)
+        journeys = profile_cache.get(cache_key)
+        if journeys is None:
+            journeys = [
+                format_journey(journey, '%H:%M')
+                for journey in profile_scan(timetable.connections[day_type], starting_point, destination)
+            ]
+            profile_cache.put(cache_key, journeys)
+
+        return jsonify({
+            'status': 'success',
+            'day_type': day_type,
+            'journeys': journeys
+        })
+
+    except Exception as e:
+        logging.error(f"Error in profile planning: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+# Largest number of queries accepted by one /api/plan/batch request
+MAX_BATCH_QUERIES = 1000
+
+@app.route('/api/plan/batch', methods=['POST'])
+def plan_journey_batch():
+    """
+    Plan many journeys against one timetable snapshot, streamed back as NDJSON.
+    Queries sharing an origin and time ('depart_after') or a destination and
+    time ('arrive_by') are answered from a single one-to-all connection scan.
+    """
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    default_mode = data.get('mode', 'depart_after')
+
+    if not isinstance(queries, list) or not queries:
+        return jsonify({
+            'status': 'error',
+            'message': 'queries must be a non-empty list'
+        }), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({
+            'status': 'error',
+            'message': f'At most {MAX_BATCH_QUERIES} queries per batch'
+        }), 400
+
+    timetable = timetable_store.get()
+    # (day_types, mode, anchor stop, minute) -> {other stop: journey}
+    scans = {}
+
+    def plan(query):
+        travel_datetime = datetime.strptime(query['travel_datetime'], '%Y-%m-%d %H:%M')
+        starting_point, destination, message = resolve_trip_stops(
+            timetable, query['starting_point'], query['destination']
+        )
+        if message:
+            raise ValueError(message)
+        mode = query.get('mode', default_mode)
+        day_types = day_types_around(travel_datetime.date())
+        connections = timetable.rolling_connections(day_types)
+
+        if mode == 'arrive_by':
+            key = (day_types, mode, destination, to_minutes(travel_datetime))
+            if key not in scans:
+                scans[key] = latest_departures_to(connections, destination, key[3])
+            return day_types[1], scans[key].get(starting_point)
+        if mode == 'depart_after':
+            key = (day_types, mode, starting_point, to_minutes(travel_datetime))
+            if key not in scans:
+                scans[key] = earliest_arrivals_from(connections, starting_point, key[3])
+            return day_types[1], scans[key].get(destination)
+        raise ValueError("mode must be 'depart_after' or 'arrive_by'")
+
+    def generate():
+        for index, query in enumerate(queries):
+            try:
+                day_type, journey = plan(query)
+                if journey:
+                    line = {
+                        'index': index,
+                        'status': 'success',
+                        'day_type': day_type,
+                        'journey': format_journey(journey, '%H:%M')
+                    }
+                else:
+                    line = {'index': index, 'status': 'error', 'message': 'No suitable route found'}
+            except (KeyError, TypeError, AttributeError, ValueError) as e:
+                line = {'index': index, 'status': 'error', 'message': f'Invalid query: {str(e)}'}
+            except Exception as e:
+                logging.error(f"Error in batch journey planning: {str(e)}")
+                line = {'index': index, 'status': 'error', 'message': str(e)}
+            yield json.dumps(line) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/optimize_fleet', methods=['POST'])
 @admin_required
 def optimize_fleet():
@@ -1794,9 +1963,10 @@ def optimize_fleet():
         population_size = int(data.get('population_size', 50))
         generations = int(data.get('generations', 30))
         mutation_rate = float(data.get('mutation_rate', 0.1))
+        workers = optimizer_workers(data.get('workers'))
 
         # Load bus data
-        bus_data = load_bus_data_from_db()
+        bus_data = timetable_store.get().bus_data
         
         # Get recent trip requests and calculate demand patterns
         thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -1813,36 +1983,23 @@ def optimize_fleet():
         # Get current fleet data
         current_fleet = {route.name: len(route.buses) for route in Route.query.all()}
 
-        # Run optimization
-        result = optimize_fleet_and_schedule(
-            bus_data, 
-            trip_requests, 
-            current_fleet, 
-            population_size, 
-            generations, 
-            mutation_rate
-        )
-
-        if result is None:
-            return jsonify({
-                'status': 'error',
-                'message': 'Optimization failed to produce results'
-            }), 500
-
-        response_data = {
-            'status': 'success',
-            'result': {
-                'optimized_fleet': result.get('optimized_fleet', {}),
-                'optimized_schedules': result.get('optimized_schedules', {}),
-                'fitness_score': result.get('fitness_score', 0),
-                'fitness_metrics': result.get('fitness_metrics', {}),
+        # Queue the run; the job saves its result when it completes
+        optimizer = build_fleet_optimizer(bus_data, trip_requests, current_fleet)
+        parameters = {
+            'population_size': population_size,
+            'generations': generations,
+            'mutation_rate': mutation_rate
+        }
+        job = optimization_jobs.submit(
+            'fleet', parameters,
+            optimization_job(optimizer, 'fleet', parameters, workers, extra={
                 'current_fleet': current_fleet,
                 'demand_patterns': hourly_demand
-            }
-        }
+            })
+        )
 
         logging.info(f"Demand patterns: {hourly_demand}")
-        return jsonify(response_data)
+        return job_response(job)
 
     except Exception as e:
         logging.error(f"Optimization error: {str(e)}")
@@ -1852,6 +2009,24 @@ def optimize_fleet():
             'message': str(e)
         }), 500
 
+@app.route('/api/optimization_jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_optimization_job(job_id):
+    """Progress of a background optimization; includes the result once completed"""
+    job = optimization_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Optimization job not found'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+@app.route('/api/optimization_jobs/<job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_optimization_job(job_id):
+    """Stop a queued or running optimization after its current generation"""
+    job = optimization_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Optimization job not found'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict(include_result=False)})
+
 @app.route('/api/optimization_metrics', methods=['GET'])
 @admin_required
 def get_optimization_metrics():
@@ -2206,6 +2381,13 @@ def get_day_type(day_of_week):
     else:
         return 'weekends'
 
+def day_types_around(travel_date):
+    """(previous day, travel day, next day) day types for the rolling timetable"""
+    return tuple(
+        get_day_type((travel_date + timedelta(days=offset)).strftime('%A').lower())
+        for offset in (-1, 0, 1)
+    )
+
 def load_bus_data_from_db():
     """Load bus data from database in the format required by optimization"""
     bus_data = {}
@@ -2213,7 +2395,7 @@ def load_bus_data_from_db():
     
     for route in routes:
         bus_data[route.name] = {
-            'stops': [stop.name for stop in route.stops],
+            'stops': [stop.name for stop in sorted(route.stops, key=lambda stop: stop.id)],
             'buses': {}
         }
         for bus in route.buses:
@@ -2222,13 +2404,65 @@ def load_bus_data_from_db():
                 'friday': [],
                 'weekends': []
             }
+            # Departures as minutes since midnight; formatted only for display
             for schedule in bus.schedules:
                 bus_data[route.name]['buses'][bus.name][schedule.day_type].append(
-                    schedule.departure_time.strftime('%H:%M')
+                    to_minutes(schedule.departure_time)
                 )
     
     return bus_data
 
+# Compiled timetable shared by all requests in this process. Route, bus and
+# schedule writes call timetable_store.invalidate() after committing.
+timetable_store = TimetableStore(load_bus_data_from_db)
+
+# Journey results for home() and /optimize_travel, keyed on the timetable version
+journey_cache = ResultCache(max_size=2048, ttl_seconds=600)
+
+# Whole-day profiles per (origin, destination, day_type), also keyed on the version
+profile_cache = ResultCache(max_size=512, ttl_seconds=3600)
+
+# Departure boards per (stop, minute, count); a board only changes when the minute does
+board_cache = ResultCache(max_size=1024, ttl_seconds=60)
+
+def write_trip_requests(records):
+    """Insert a batch of TripRequest rows in one transaction"""
+    with app.app_context():
+        try:
+            db.session.bulk_insert_mappings(TripRequest, records)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+# Rider searches are logged through this queue; anything left is flushed at shutdown
+trip_request_log = None
+
+# Optimizer runs from /optimization and /optimize_fleet, one at a time
+optimization_jobs = None
+
+_services_lock = threading.Lock()
+
+@app.before_first_request
+def init_services():
+    """
+    Create the tables and start the trip request writer and the optimization
+    job runner, once per server process. Kept out of module import so that
+    spawned optimizer workers, which re-import this file as __mp_main__, and
+    scripts importing the models start no threads and touch no database.
+    """
+    global trip_request_log, optimization_jobs
+    with _services_lock:
+        if trip_request_log is not None:
+            return
+
+        with app.app_context():
+            db.create_all()
+
+        trip_request_log = WriteBehindQueue(write_trip_requests, name='trip-request-log')
+        atexit.register(trip_request_log.close)
+        optimization_jobs = JobRunner(max_workers=1)
+
 @app.route('/update_driver_location', methods=['POST'])
 @role_required(['driver'])
 def update_driver_location():
@@ -0,0 +1,23 @@
+"""
+Process-pool entry points for BusScheduleOptimizer fitness evaluation.
+
+Spawned workers unpickle their initializer and tasks from this module, so it
+is kept free of import-time side effects: no logging setup, no app imports.
+"""
+
+# Optimizer rebuilt once in each fitness worker process
+_worker_optimizer = None
+
+
+def init_worker(optimizer_class, state):
+    """Pool initializer: rebuild the optimizer from BusScheduleOptimizer._worker_state"""
+    global _worker_optimizer
+    _worker_optimizer = optimizer_class.__new__(optimizer_class)
+    _worker_optimizer.__dict__.update(state)
+
+
+def evaluate_genomes(genomes):
+    """Fitness and metrics for a chunk of genomes, run inside a worker"""
+    population = [_worker_optimizer._decode_genome(genome) for genome in genomes]
+    fitness = _worker_optimizer._evaluate_population(population)
+    return fitness.tolist(), [individual['fitness_metrics'] for individual in population]
@@ -1,7 +1,8 @@
 import random
 import logging
 import traceback
-from datetime import datetime, timedelta
+from timetable import CompiledTimetable, DAY_MINUTES, to_minutes, format_minutes, shortest_segment
+from journey_planner import direct_rides, pareto_earliest_arrival, pareto_latest_departure, format_journey
 
 # Set up logging
 logging.basicConfig(
@@ -9,69 +10,110 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def optimize_user_travel(bus_data, travel_datetime, starting_point, destination, population_size=50, generations=100, mutation_rate=0.1):
-    """Optimize user travel path using genetic algorithm"""
+# Longest transfer journey worth offering, including the transfer itself
+MAX_TRANSFER_JOURNEY_MINUTES = 120
+
+# Upper bound on memoized genomes per rider query
+FITNESS_MEMO_SIZE = 4096
+
+class FitnessMemo:
+    """Bounded per-query memo of fitness scores keyed on the (route, departure_time) genome"""
+
+    def __init__(self, fitness_func, max_size=FITNESS_MEMO_SIZE):
+        self.fitness_func = fitness_func
+        self.max_size = max_size
+        self.scores = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, individual):
+        if individual is None:
+            return self.fitness_func(individual)
+
+        # The bus does not affect fitness, so it is not part of the key
+        key = (individual['route'], individual['departure_time'])
+        score = self.scores.get(key)
+        if score is not None:
+            self.hits += 1
+            return score
+
+        self.misses += 1
+        score = self.fitness_func(individual)
+        if len(self.scores) >= self.max_size:
+            # Drop the oldest entry to stay bounded
+            del self.scores[next(iter(self.scores))]
+        self.scores[key] = score
+        return score
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.scores)}
+
+def optimize_user_travel(bus_data, travel_datetime, starting_point, destination, population_size=50, generations=100, mutation_rate=0.1, timetable=None, method='exact', limit=3):
+    """
+    Optimize user travel path. method='exact' enumerates the sorted departures
+    and returns the best direct trip; method='genetic' runs the genetic algorithm.
+    Without a direct ride, transfer journeys come from the McRAPTOR search,
+    ranked best first, with up to limit - 1 runners-up in 'alternatives'.
+    """
     try:
+        if timetable is None:
+            timetable = CompiledTimetable(bus_data)
+
+        day_type = get_day_type(travel_datetime.strftime('%A').lower())
+        network = timetable.networks[day_type]
+
+        # Single-bus rides between the stops on routes running that day, looked
+        # up once for the whole population. Departures leave the route's first
+        # stop, as in every planner (see CompiledTimetable).
+        rides = direct_rides(network, starting_point, destination)
+        shortest_rides = {}
+        for route, board_position, alight_position in rides:
+            ride = shortest_rides.get(route.name)
+            if ride is None or alight_position - board_position < ride[2] - ride[1]:
+                shortest_rides[route.name] = (route, board_position, alight_position)
+        valid_routes = list(shortest_rides)
+
+        desired_minutes = to_minutes(travel_datetime)
+
         def fitness(individual):
             """Calculate fitness score for an individual solution"""
             if individual is None:
                 return 0
 
-            route = individual['route']
-            departure_time = datetime.strptime(individual['departure_time'], "%H:%M").time()
-            route_stops = bus_data[route]['stops']
-            
-            start_index = route_stops.index(starting_point)
-            end_index = route_stops.index(destination)
-            
-            # Calculate travel time
-            travel_time = calculate_travel_time(start_index, end_index, len(route_stops))
-            arrival_time = (datetime.combine(travel_datetime.date(), departure_time) + 
-                        timedelta(minutes=travel_time.total_seconds() / 60)).time()
-
-            # Calculate time difference from desired arrival
-            time_diff = calculate_time_difference(arrival_time, travel_datetime.time())
-            
-            # Penalize late arrivals more heavily
-            return 1 / (time_diff + (100 if arrival_time > travel_datetime.time() else 1))
+            # Genomes carry the trip's start at the route's first stop, in minutes since midnight
+            route, _, alight_position = shortest_rides[individual['route']]
+            arrival = individual['departure_time'] + route.offsets[alight_position]
+            return arrival_score(arrival, desired_minutes)
 
         def create_individual():
             """Create a single individual for the genetic algorithm"""
-            # Find valid routes containing both stops
-            valid_routes = []
-            for route_name, route_data in bus_data.items():
-                if starting_point in route_data['stops'] and destination in route_data['stops']:
-                    valid_routes.append(route_name)
-            
             if not valid_routes:
                 return None
             
-            route = random.choice(valid_routes)
-            day_type = get_day_type(travel_datetime.strftime('%A').lower())
-            
-            # Get available departure times
-            departure_times = []
-            for bus, schedules in bus_data[route]['buses'].items():
-                if day_type in schedules:
-                    departure_times.extend(schedules[day_type])
-            
-            if not departure_times:
-                return None
+            route = shortest_rides[random.choice(valid_routes)][0]
+            trip = random.randrange(len(route))
             
             return {
-                'route': route,
-                'departure_time': random.choice(departure_times),
-                'bus': random.choice(list(bus_data[route]['buses'].keys()))
+                'route': route.name,
+                'departure_time': route.departures[trip],
+                'bus': route.buses[trip]
             }
 
+        # Exact search scores the same objective without sampling
+        if valid_routes and method == 'exact':
+            best = find_best_direct_departure(rides, desired_minutes)
+            if best is None:
+                return None
+
+            route, trip, board_position, alight_position = best
+            return direct_option(
+                route, route.departures[trip], route.buses[trip], board_position, alight_position
+            )
+
         # First check for direct route
-        direct_route = None
-        for route_name, route_data in bus_data.items():
-            if starting_point in route_data['stops'] and destination in route_data['stops']:
-                direct_route = route_name
-                break
-        
-        if direct_route:
+        if valid_routes:
+            fitness = FitnessMemo(fitness)
+
             # Evolution process
             population = [create_individual() for _ in range(population_size)]
             population = [ind for ind in population if ind is not None]
@@ -87,40 +129,27 @@ def optimize_user_travel(bus_data, travel_datetime, starting_point, destination,
             # Get best solution
             best_individual = max(population, key=fitness)
             if best_individual:
-                route_stops = bus_data[best_individual['route']]['stops']
-                travel_time = calculate_travel_time(
-                    route_stops.index(starting_point),
-                    route_stops.index(destination),
-                    len(route_stops)
+                route, board_position, alight_position = shortest_rides[best_individual['route']]
+                return dict(
+                    direct_option(
+                        route, best_individual['departure_time'], best_individual['bus'],
+                        board_position, alight_position
+                    ),
+                    fitness_cache=fitness.stats()
                 )
-                
-                return {
-                    'route_type': 'direct',
-                    'route': best_individual['route'],
-                    'departure_time': best_individual['departure_time'],
-                    'travel_time': travel_time.total_seconds() / 60,
-                    'stops': get_route_stops(route_stops, starting_point, destination)
-                }
         
-        # If no direct route, find alternative routes
-        alternative_routes = find_alternative_routes(bus_data, starting_point, destination)
-        if alternative_routes:
-            best_alternative = alternative_routes[0]  # Take first alternative for now
-            times = calculate_alternative_route_times(
-                bus_data,
-                best_alternative,
-                travel_datetime,
-                get_day_type(travel_datetime.strftime('%A').lower())
+        # If no direct route, take the Pareto-optimal transfer journeys of the
+        # McRAPTOR search, reaching the destination by the desired time if possible
+        journeys = pareto_latest_departure(
+            network, starting_point, destination, desired_minutes, limit=limit
+        )
+        if not journeys:
+            journeys = pareto_earliest_arrival(
+                network, starting_point, destination, desired_minutes, limit=limit
             )
-            
-            if times:
-                return {
-                    'route_type': 'alternative',
-                    'first_route': best_alternative['first_route'],
-                    'second_route': best_alternative['second_route'],
-                    'transfer_stop': best_alternative['transfer_stop'],
-                    'times': times
-                }
+        if journeys:
+            options = [transfer_option(journey) for journey in journeys]
+            return dict(options[0], alternatives=options[1:])
         
         return None
         
@@ -129,6 +158,79 @@ def optimize_user_travel(bus_data, travel_datetime, starting_point, destination,
         logging.error(traceback.format_exc())
         return None
 
+def arrival_score(arrival, desired):
+    """Fitness of arriving at minute arrival for a desired arrival minute; late arrivals are penalized"""
+    arrival = arrival % (24 * 60)
+    time_diff = abs(int(arrival) - desired)
+    return 1 / (time_diff + (100 if arrival > desired else 1))
+
+def find_best_direct_departure(rides, desired):
+    """
+    Exact counterpart of the genetic search: returns the (route, trip,
+    board_position, alight_position) of direct_rides whose arrival has the
+    highest arrival_score, or None if no trip runs.
+    """
+    best = None
+    best_score = 0
+
+    for route, board_position, alight_position in rides:
+        # Only the trips either side of the desired arrival can score best,
+        # both on the same day and for trips arriving after midnight
+        candidates = set()
+        for target in (desired, desired + DAY_MINUTES):
+            candidates.update((
+                route.latest_trip(alight_position, target),
+                route.earliest_trip(alight_position, target)
+            ))
+        candidates.discard(None)
+
+        for trip in sorted(candidates):
+            score = arrival_score(route.time_at(trip, alight_position), desired)
+            if score > best_score:
+                best, best_score = (route, trip, board_position, alight_position), score
+
+    return best
+
+def direct_option(route, start_minute, bus, board_position, alight_position):
+    """Response for a direct ride on the trip leaving route's first stop at start_minute"""
+    departure = start_minute + route.offsets[board_position]
+    arrival = start_minute + route.offsets[alight_position]
+    return {
+        'route_type': 'direct',
+        'route': route.name,
+        'bus': bus,
+        'departure_time': format_minutes(departure),
+        'arrival_time': format_minutes(arrival),
+        'travel_time': round(arrival - departure, 1),
+        'stops': list(route.stops[board_position:alight_position + 1])
+    }
+
+def transfer_option(journey):
+    """Response for a McRAPTOR journey; first and second route are its first and last legs"""
+    first_leg, last_leg = journey['legs'][0], journey['legs'][-1]
+    return {
+        'route_type': 'alternative',
+        'first_route': first_leg['route'],
+        'second_route': last_leg['route'],
+        'transfer_stop': first_leg['alight_stop'],
+        'transfers': journey['transfers'],
+        'times': {
+            'first_route_times': [format_minutes(first_leg['departure'])],
+            'second_route_times': [format_minutes(last_leg['departure'])],
+            'first_departure': format_minutes(first_leg['departure']),
+            'transfer_time': format_minutes(first_leg['arrival']),
+            'second_departure': format_minutes(last_leg['departure']),
+            'final_arrival': format_minutes(last_leg['arrival']),
+            'first_leg_time': round(first_leg['arrival'] - first_leg['departure'], 1),
+            'second_leg_time': round(last_leg['arrival'] - last_leg['departure'], 1),
+            'total_time': round(journey['arrival'] - journey['departure'], 1),
+            'wait_time': round(journey['wait'], 1),
+            # Suggested arrival at the stop, 5 minutes before first departure
+            'suggested_arrival': format_minutes(journey['departure'] - 5, '%I:%M %p')
+        },
+        'legs': format_journey(journey, '%H:%M')['legs']
+    }
+
 def get_day_type(day_of_week):
     """Determines the day type (weekdays, friday, weekends) from the day of week"""
     if day_of_week in ['monday', 'tuesday', 'wednesday', 'thursday']:
@@ -138,140 +240,6 @@ def get_day_type(day_of_week):
     else:
         return 'weekends'
 
-def find_closest_departure_time(departure_times, travel_datetime, route_stops, start, dest):
-    """Finds the optimal departure time to reach destination at desired time"""
-    closest_departure = None
-    min_wait_time = timedelta.max
-    start_idx = route_stops.index(start)
-    end_idx = route_stops.index(dest)
-    
-    # Calculate travel time for this route
-    travel_time = calculate_travel_time(start_idx, end_idx, len(route_stops))
-    
-    # Work backwards from desired arrival time
-    desired_arrival = travel_datetime
-    ideal_departure = desired_arrival - travel_time
-    
-    for dep_time in departure_times:
-        # Convert departure time string to datetime
-        dep_datetime = datetime.combine(
-            travel_datetime.date(), 
-            datetime.strptime(dep_time, "%H:%M").time()
-        )
-        
-        # Calculate arrival time for this departure
-        arrival_time = dep_datetime + travel_time
-        
-        # Check if this departure gets us there before desired time
-        if arrival_time <= desired_arrival:
-            wait_time = desired_arrival - arrival_time
-            
-            # Prioritize arrivals that are 5-15 minutes before desired time
-            if timedelta(minutes=5) <= wait_time <= timedelta(minutes=15):
-                if wait_time < min_wait_time:
-                    min_wait_time = wait_time
-                    closest_departure = dep_time
-    
-    # If no ideal time found, look for any departure that gets us there before desired time
-    if not closest_departure:
-        latest_possible = None
-        min_difference = timedelta.max
-        
-        for dep_time in departure_times:
-            dep_datetime = datetime.combine(
-                travel_datetime.date(), 
-                datetime.strptime(dep_time, "%H:%M").time()
-            )
-            arrival_time = dep_datetime + travel_time
-            
-            if arrival_time <= desired_arrival:
-                difference = desired_arrival - arrival_time
-                if difference < min_difference:
-                    min_difference = difference
-                    latest_possible = dep_time
-        
-        closest_departure = latest_possible
-    
-    return closest_departure
-
-def calculate_travel_time(start_idx, end_idx, total_stops):
-    """Calculates optimized travel time between stops"""
-    # Calculate number of stops between start and end
-    if start_idx < end_idx:
-        num_stops = end_idx - start_idx
-    else:
-        num_stops = total_stops - start_idx + end_idx
-    
-    # Base time calculation: 3-4 minutes between stops with traffic consideration
-    base_time = num_stops * 3.5
-    
-    # Add buffer based on number of stops and time of day
-    buffer_time = min(num_stops * 0.8, 15)  # Maximum 15 minute buffer for long routes
-    
-    return timedelta(minutes=(base_time + buffer_time))
-
-def find_optimal_departure_time(travel_datetime, schedules, route_stops, start, dest, day_type):
-    """Find the optimal departure time that ensures arrival before desired time"""
-    travel_time = calculate_travel_time(
-        route_stops.index(start),
-        route_stops.index(dest),
-        len(route_stops)
-    )
-    
-    # Add 10 minutes buffer for boarding and potential delays
-    total_journey_time = travel_time + timedelta(minutes=10)
-    
-    # Calculate ideal departure time working backwards
-    ideal_departure = travel_datetime - total_journey_time
-    
-    # Get all available departure times for the day
-    available_departures = []
-    for departure_time in schedules:
-        dep_time = datetime.strptime(departure_time, '%H:%M').time()
-        dep_datetime = datetime.combine(travel_datetime.date(), dep_time)
-        
-        # Calculate estimated arrival for this departure
-        est_arrival = dep_datetime + total_journey_time
-        
-        # Only consider departures that get us there before desired time
-        if est_arrival <= travel_datetime:
-            time_diff = travel_datetime - est_arrival
-            # Prioritize arrivals 5-15 minutes before desired time
-            if timedelta(minutes=5) <= time_diff <= timedelta(minutes=15):
-                available_departures.append({
-                    'departure': dep_datetime,
-                    'arrival': est_arrival,
-                    'wait_time': time_diff,
-                    'score': abs((time_diff - timedelta(minutes=10)).total_seconds())  # Optimal: 10 min early
-                })
-    
-    if available_departures:
-        # Sort by score (closest to 10 minutes early)
-        optimal_journey = min(available_departures, key=lambda x: x['score'])
-        return {
-            'departure_time': optimal_journey['departure'].strftime('%H:%M'),
-            'arrival_time': optimal_journey['arrival'].strftime('%H:%M'),
-            'suggested_arrival': (optimal_journey['departure'] - timedelta(minutes=10)).strftime('%I:%M %p'),
-            'travel_time': travel_time.total_seconds() / 60
-        }
-    
-    return None
-
-def calculate_time_difference(time1, time2):
-    """Calculates difference between two times in minutes"""
-    t1_minutes = time1.hour * 60 + time1.minute
-    t2_minutes = time2.hour * 60 + time2.minute
-    return abs(t1_minutes - t2_minutes)
-
-def get_route_stops(route_stops, start, dest):
-    """Gets ordered list of stops between start and destination"""
-    start_idx = route_stops.index(start)
-    end_idx = route_stops.index(dest)
-    
-    if start_idx < end_idx:
-        return route_stops[start_idx:end_idx + 1]
-    return route_stops[start_idx:] + route_stops[:end_idx + 1]
-
 def evolve_population(population, fitness_func, mutation_rate):
     """Evolves a population for user travel optimization"""
     fitness_scores = [fitness_func(ind) for ind in population]
@@ -308,48 +276,42 @@ def mutate_individual(individual, mutation_rate):
     
     new_individual = individual.copy()
     if random.random() < 0.5:
-        new_individual['departure_time'] = str(
-            random.randint(0, 23)).zfill(2) + ':' + str(random.randint(0, 59)).zfill(2)
+        new_individual['departure_time'] = random.randint(0, 23) * 60 + random.randint(0, 59)
     return new_individual
 
-def find_alternative_routes(bus_data, starting_point, destination, travel_datetime=None):
+def find_alternative_routes(bus_data, starting_point, destination, timetable=None):
     """
     Find alternative routes with optimized timing when direct route is not available.
     """
+    if timetable is None:
+        timetable = CompiledTimetable(bus_data)
+
     alternative_routes = []
+    stop_index = timetable.stop_index
+    travel_times = timetable.travel_times
     
-    # Find all routes containing the starting point
-    start_routes = []
-    for route_name, route_data in bus_data.items():
-        if starting_point in route_data['stops']:
-            start_routes.append(route_name)
-    
-    # Find all routes containing the destination
-    dest_routes = []
-    for route_name, route_data in bus_data.items():
-        if destination in route_data['stops']:
-            dest_routes.append(route_name)
+    # Routes containing the starting point and routes containing the destination
+    start_routes = stop_index.routes_serving(starting_point)
+    dest_routes = stop_index.routes_serving(destination)
     
-    # Find valid transfer combinations
+    # Find valid transfer combinations from the compiled transfer table
     for start_route in start_routes:
-        start_stops = set(bus_data[start_route]['stops'])
+        start_positions = stop_index.positions_on(starting_point, start_route)
         
         for dest_route in dest_routes:
             if start_route == dest_route:
                 continue
-                
-            dest_stops = set(bus_data[dest_route]['stops'])
-            transfer_stops = start_stops.intersection(dest_stops)
+            dest_positions = stop_index.positions_on(destination, dest_route)
             
-            for transfer_stop in transfer_stops:
-                if is_valid_transfer_path(
-                    bus_data, 
-                    start_route, 
-                    dest_route, 
-                    starting_point, 
-                    transfer_stop, 
-                    destination
-                ):
+            for transfer_stop, first_positions, second_positions in timetable.transfers.between(start_route, dest_route):
+                # Best pair of visits on each leg of a looping route
+                first_leg_time = travel_times.between(start_route, *shortest_segment(
+                    start_positions, first_positions, stop_index.route_lengths[start_route]))
+                second_leg_time = travel_times.between(dest_route, *shortest_segment(
+                    second_positions, dest_positions, stop_index.route_lengths[dest_route]))
+                
+                # Keep only journeys under 2 hours, including 10 minutes to transfer
+                if first_leg_time + second_leg_time + 10 <= MAX_TRANSFER_JOURNEY_MINUTES:
                     alternative_routes.append({
                         'first_route': start_route,
                         'second_route': dest_route,
@@ -360,146 +322,140 @@ def find_alternative_routes(bus_data, starting_point, destination, travel_dateti
     
     return alternative_routes
 
-def is_valid_transfer_path(bus_data, start_route, dest_route, start_stop, transfer_stop, dest_stop):
+def is_valid_transfer_path(timetable, start_route, dest_route, start_stop, transfer_stop, dest_stop, day_type='weekdays'):
     """
-    Check if the transfer path is valid and efficient
+    Check if the transfer path is valid and efficient: both legs can be
+    ridden on a single trip of their route on day_type and the journey
+    takes under MAX_TRANSFER_JOURNEY_MINUTES
     """
     try:
-        # Get stop indices for first route
-        first_route_stops = bus_data[start_route]['stops']
-        start_idx = first_route_stops.index(start_stop)
-        transfer_idx_first = first_route_stops.index(transfer_stop)
-        
-        # Get stop indices for second route
-        second_route_stops = bus_data[dest_route]['stops']
-        transfer_idx_second = second_route_stops.index(transfer_stop)
-        dest_idx = second_route_stops.index(dest_stop)
-        
         # Check first route segment
         if start_route == dest_route:
             return False
         
-        # For circular routes, handle wraparound
-        if start_idx > transfer_idx_first:
-            transfer_idx_first += len(first_route_stops)
-        if transfer_idx_second > dest_idx:
-            dest_idx += len(second_route_stops)
+        network = timetable.networks[day_type]
+        first_leg = shortest_ride(network, start_route, start_stop, transfer_stop)
+        second_leg = shortest_ride(network, dest_route, transfer_stop, dest_stop)
+        if first_leg is None or second_leg is None:
+            return False
         
-        # Check total journey length is reasonable
-        first_leg_time = calculate_travel_time(start_idx, transfer_idx_first, len(first_route_stops))
-        second_leg_time = calculate_travel_time(transfer_idx_second, dest_idx, len(second_route_stops))
-        total_time = first_leg_time + second_leg_time + timedelta(minutes=10)  # Including transfer time
+        # In-vehicle minutes between the boarding and alighting positions of one trip
+        first_leg_time = ride_minutes(*first_leg)
+        second_leg_time = ride_minutes(*second_leg)
+        total_time = first_leg_time + second_leg_time + 10  # Including transfer time
         
         # Return true only if total journey time is reasonable (e.g., less than 2 hours)
-        return total_time <= timedelta(hours=2)
+        return total_time <= MAX_TRANSFER_JOURNEY_MINUTES
         
-    except (ValueError, IndexError):
+    except (KeyError, IndexError):
         return False
 
-def calculate_alternative_route_times(bus_data, route_combo, travel_datetime, day_type):
+def shortest_ride(network, route_name, start, dest):
+    """(route, board_position, alight_position) of the shortest single-trip ride on route_name, or None"""
+    rides = [ride for ride in direct_rides(network, start, dest) if ride[0].name == route_name]
+    return min(rides, key=lambda ride: ride[2] - ride[1], default=None)
+
+def ride_minutes(route, board_position, alight_position):
+    """In-vehicle minutes of a ride; every trip of the route takes the same time"""
+    return route.offsets[alight_position] - route.offsets[board_position]
+
+def calculate_alternative_route_times(bus_data, route_combo, travel_datetime, day_type, timetable=None):
     """
     Calculate optimized timings for alternative routes working backwards from desired arrival time
-    with improved buffer and transfer time calculations
+    with improved buffer and transfer time calculations.
+    route_combo may be a single combination or a list of them; a list returns a list of timings.
+    """
+    if timetable is None:
+        timetable = CompiledTimetable(bus_data)
+
+    network = timetable.networks[day_type]
+    if isinstance(route_combo, (list, tuple)):
+        return [
+            _alternative_route_times(network, combo, travel_datetime)
+            for combo in route_combo
+        ]
+    return _alternative_route_times(network, route_combo, travel_datetime)
+
+def _alternative_route_times(network, route_combo, travel_datetime):
+    """
+    Timing for one transfer combination on network's trips. Trips leave
+    their route's first stop at the scheduled minute (see CompiledTimetable),
+    so each leg is timed with RouteTrips.time_at at its boarding and
+    alighting positions.
     """
-    first_route = route_combo['first_route']
-    second_route = route_combo['second_route']
     transfer_stop = route_combo['transfer_stop']
-    desired_arrival = travel_datetime
-    
-    # Get route stops and calculate travel times
-    first_route_stops = bus_data[first_route]['stops']
-    second_route_stops = bus_data[second_route]['stops']
+    first_leg = shortest_ride(network, route_combo['first_route'], route_combo['starting_point'], transfer_stop)
+    second_leg = shortest_ride(network, route_combo['second_route'], transfer_stop, route_combo['destination'])
     
-    # Calculate leg times with more precise buffers
-    start_idx = first_route_stops.index(route_combo['starting_point'])
-    transfer_idx = first_route_stops.index(transfer_stop)
-    first_leg_time = calculate_travel_time(start_idx, transfer_idx, len(first_route_stops))
+    # Define buffer times more precisely (minutes)
+    boarding_buffer = 5  # Time to board the first bus
+    transfer_buffer = 8  # Transfer time between buses
+    arrival_buffer = 5   # Buffer before desired arrival time
+    min_transfer_wait = 5
     
-    transfer_idx_second = second_route_stops.index(transfer_stop)
-    dest_idx = second_route_stops.index(route_combo['destination'])
-    second_leg_time = calculate_travel_time(transfer_idx_second, dest_idx, len(second_route_stops))
-    
-    # Define buffer times more precisely
-    boarding_buffer = timedelta(minutes=5)  # Time to board the first bus
-    transfer_buffer = timedelta(minutes=8)  # Transfer time between buses
-    arrival_buffer = timedelta(minutes=5)   # Buffer before desired arrival time
-    
-    # Get all departure times
-    first_route_times = []
-    second_route_times = []
-    
-    # Collect all departure times for both routes
-    for bus, schedules in bus_data[first_route]['buses'].items():
-        if day_type in schedules:
-            first_route_times.extend(schedules[day_type])
-    for bus, schedules in bus_data[second_route]['buses'].items():
-        if day_type in schedules:
-            second_route_times.extend(schedules[day_type])
-    
-    # Sort and remove duplicates
-    first_route_times = sorted(list(set(first_route_times)))
-    second_route_times = sorted(list(set(second_route_times)))
+    if first_leg is None or second_leg is None:
+        # A leg cannot be ridden on one trip that day
+        return {'first_route_times': [], 'second_route_times': []}
+    first_route, first_board, first_alight = first_leg
+    second_route, second_board, second_alight = second_leg
     
     # Work backwards from desired arrival time
-    best_combination = None
-    min_total_wait = timedelta(hours=24)
+    ideal_arrival = to_minutes(travel_datetime) - arrival_buffer
     
-    # Convert desired arrival to datetime
-    desired_arrival_dt = datetime.combine(desired_arrival.date(), desired_arrival.time())
-    ideal_arrival = desired_arrival_dt - arrival_buffer
+    best_combination = None
+    min_total_wait = DAY_MINUTES
     
-    # Find suitable second leg departure that gets us to destination on time
-    for second_dep in second_route_times:
-        second_dep_time = datetime.strptime(second_dep, "%H:%M").time()
-        second_dep_dt = datetime.combine(desired_arrival.date(), second_dep_time)
-        second_arrival = second_dep_dt + second_leg_time
+    # Second-leg trips that reach the destination in time
+    last_second_trip = second_route.latest_trip(second_alight, ideal_arrival)
+    for second_trip in range(last_second_trip + 1 if last_second_trip is not None else 0):
+        second_dep = second_route.time_at(second_trip, second_board)
+        second_arrival = second_route.time_at(second_trip, second_alight)
         
-        # Check if this arrival time is suitable
-        if second_arrival <= ideal_arrival:
-            # Calculate required transfer arrival time
-            required_transfer_time = second_dep_dt - transfer_buffer
-            
-            # Find suitable first leg departure
-            for first_dep in first_route_times:
-                first_dep_time = datetime.strptime(first_dep, "%H:%M").time()
-                first_dep_dt = datetime.combine(desired_arrival.date(), first_dep_time)
-                first_arrival = first_dep_dt + first_leg_time
-                
-                # Check if this gets us to transfer point on time
-                if first_arrival <= required_transfer_time:
-                    transfer_wait = required_transfer_time - first_arrival
-                    total_wait = (ideal_arrival - second_arrival) + transfer_wait
-                    
-                    # Update best combination if this timing is better
-                    if total_wait < min_total_wait and transfer_wait >= timedelta(minutes=5):
-                        min_total_wait = total_wait
-                        
-                        # Calculate suggested arrival time (5 minutes before first departure)
-                        suggested_arrival = first_dep_dt - boarding_buffer
-                        
-                        best_combination = {
-                            'first_route_times': [first_dep],
-                            'second_route_times': [second_dep],
-                            'first_departure': first_dep,
-                            'transfer_time': first_arrival.strftime("%H:%M"),
-                            'second_departure': second_dep,
-                            'final_arrival': second_arrival.strftime("%H:%M"),
-                            'first_leg_time': first_leg_time.total_seconds() / 60,
-                            'second_leg_time': second_leg_time.total_seconds() / 60,
-                            'total_time': (first_leg_time + transfer_buffer + second_leg_time).total_seconds() / 60,
-                            'suggested_arrival': suggested_arrival.strftime("%I:%M %p"),
-                            'buffers': {
-                                'boarding': boarding_buffer.total_seconds() / 60,
-                                'transfer': transfer_buffer.total_seconds() / 60,
-                                'arrival': arrival_buffer.total_seconds() / 60
-                            }
-                        }
+        # Latest first-leg trip that reaches the transfer stop with the minimum wait
+        required_transfer_time = second_dep - transfer_buffer
+        first_trip = first_route.latest_trip(first_alight, required_transfer_time - min_transfer_wait)
+        if first_trip is None:
+            continue
+        
+        first_arrival = first_route.time_at(first_trip, first_alight)
+        transfer_wait = required_transfer_time - first_arrival
+        total_wait = (ideal_arrival - second_arrival) + transfer_wait
+        
+        if total_wait < min_total_wait:
+            min_total_wait = total_wait
+            best_combination = (
+                first_route.time_at(first_trip, first_board), first_arrival, second_dep, second_arrival
+            )
     
-    # If no ideal combination found, return available times
+    # If no ideal combination found, return available times at the boarding and transfer stops
     if not best_combination:
         return {
-            'first_route_times': first_route_times,
-            'second_route_times': second_route_times
+            'first_route_times': [
+                format_minutes(first_route.time_at(trip, first_board)) for trip in range(len(first_route))
+            ],
+            'second_route_times': [
+                format_minutes(second_route.time_at(trip, second_board)) for trip in range(len(second_route))
+            ]
         }
     
-    return best_combination
\ No newline at end of file
+    first_leg_time = ride_minutes(*first_leg)
+    second_leg_time = ride_minutes(*second_leg)
+    first_dep, first_arrival, second_dep, second_arrival = best_combination
+    return {
+        'first_route_times': [format_minutes(first_dep)],
+        'second_route_times': [format_minutes(second_dep)],
+        'first_departure': format_minutes(first_dep),
+        'transfer_time': format_minutes(first_arrival),
+        'second_departure': format_minutes(second_dep),
+        'final_arrival': format_minutes(second_arrival),
+        'first_leg_time': round(first_leg_time, 1),
+        'second_leg_time': round(second_leg_time, 1),
+        'total_time': round(first_leg_time + transfer_buffer + second_leg_time, 1),
+        # Suggested arrival at the stop, 5 minutes before first departure
+        'suggested_arrival': format_minutes(first_dep - boarding_buffer, '%I:%M %p'),
+        'buffers': {
+            'boarding': boarding_buffer,
+            'transfer': transfer_buffer,
+            'arrival': arrival_buffer
+        }
+    }
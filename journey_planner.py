@@ -0,0 +1,672 @@
+import heapq
+import logging
+from bisect import bisect_left, bisect_right
+from timetable import DAY_MINUTES, format_minutes, format_day_minutes
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Minutes needed to change buses at a transfer stop
+TRANSFER_BUFFER = 8
+
+
+def earliest_arrival(network, source, target, departure, max_transfers=3, transfer_buffer=TRANSFER_BUFFER):
+    """
+    Round-based (RAPTOR) search for the earliest arrival at target when
+    leaving source at or after departure (minutes since midnight).
+    Round k rides k + 1 buses, so at most max_transfers + 1 rounds run and
+    each round scans every trip of the touched routes once.
+
+    Returns the Pareto set over (arrival, transfers), fewest transfers first.
+    """
+    if source == target:
+        return []
+
+    best = {source: departure}
+    # stop -> (minute the rider can board there, round that reached it)
+    ready = {source: (departure, -1)}
+    rounds = []
+    journeys = []
+    marked = {source}
+
+    for rnd in range(max_transfers + 1):
+        # Each route is scanned once, from the earliest marked stop on it
+        queue = {}
+        for stop in marked:
+            for route, positions in network.routes_at(stop):
+                if route.name not in queue or positions[0] < queue[route.name][1]:
+                    queue[route.name] = (route, positions[0])
+
+        labels = {}
+        for route, first_position in queue.values():
+            trip = None
+            board_position = board_round = None
+            for position in range(first_position, len(route.stops)):
+                stop = route.stops[position]
+
+                if trip is not None:
+                    arrival = route.time_at(trip, position)
+                    if arrival < best.get(stop, float('inf')) and arrival < best.get(target, float('inf')):
+                        best[stop] = arrival
+                        labels[stop] = (arrival, route, trip, board_position, position, board_round)
+
+                # Catch an earlier trip if the rider is already waiting here
+                if stop in ready:
+                    ready_at, ready_round = ready[stop]
+                    candidate = route.earliest_trip(position, ready_at)
+                    if candidate is not None and (trip is None or candidate < trip):
+                        trip = candidate
+                        board_position = position
+                        board_round = ready_round
+
+        if not labels:
+            break
+
+        rounds.append(labels)
+        for stop, label in labels.items():
+            ready[stop] = (label[0] + transfer_buffer, rnd)
+        marked = set(labels)
+
+        if target in labels:
+            journeys.append(_forward_journey(rounds, rnd, target))
+
+    return journeys
+
+
+def latest_departure(network, source, target, arrival, max_transfers=3, transfer_buffer=TRANSFER_BUFFER):
+    """
+    Reverse RAPTOR search for the latest departure from source that still
+    reaches target by arrival (minutes since midnight).
+
+    Returns the Pareto set over (departure, transfers), fewest transfers first.
+    """
+    if source == target:
+        return []
+
+    best = {target: arrival}
+    # stop -> (minute the rider must be off the bus there, round that reached it)
+    deadline = {target: (arrival, -1)}
+    rounds = []
+    journeys = []
+    marked = {target}
+
+    for rnd in range(max_transfers + 1):
+        # Each route is scanned backwards once, from the latest marked stop on it
+        queue = {}
+        for stop in marked:
+            for route, positions in network.routes_at(stop):
+                if route.name not in queue or positions[-1] > queue[route.name][1]:
+                    queue[route.name] = (route, positions[-1])
+
+        labels = {}
+        for route, last_position in queue.values():
+            trip = None
+            alight_position = alight_round = None
+            for position in range(last_position, -1, -1):
+                stop = route.stops[position]
+
+                if trip is not None:
+                    departure = route.time_at(trip, position)
+                    if departure > best.get(stop, float('-inf')) and departure > best.get(source, float('-inf')):
+                        best[stop] = departure
+                        labels[stop] = (departure, route, trip, position, alight_position, alight_round)
+
+                # Catch a later trip if it still gets the rider here in time
+                if stop in deadline:
+                    deadline_at, deadline_round = deadline[stop]
+                    candidate = route.latest_trip(position, deadline_at)
+                    if candidate is not None and (trip is None or candidate > trip):
+                        trip = candidate
+                        alight_position = position
+                        alight_round = deadline_round
+
+        if not labels:
+            break
+
+        rounds.append(labels)
+        for stop, label in labels.items():
+            deadline[stop] = (label[0] - transfer_buffer, rnd)
+        marked = set(labels)
+
+        if source in labels:
+            journeys.append(_reverse_journey(rounds, rnd, source))
+
+    return journeys
+
+
+def pareto_earliest_arrival(network, source, target, departure, max_transfers=3,
+                            transfer_buffer=TRANSFER_BUFFER, window=120, limit=None):
+    """
+    Multi-criteria RAPTOR leaving source at or after departure. Keeps every
+    journey that is Pareto-optimal over (arrival, transfers, waiting time at
+    transfer stops), boarding at source up to window minutes after departure.
+
+    Returns the journeys ranked best first, at most limit of them.
+    """
+    return _pareto_search(network, source, target, departure, max_transfers,
+                          transfer_buffer, window, limit, reverse=False)
+
+
+def pareto_latest_departure(network, source, target, arrival, max_transfers=3,
+                            transfer_buffer=TRANSFER_BUFFER, window=120, limit=None):
+    """
+    Reverse multi-criteria RAPTOR reaching target by arrival. Keeps every
+    journey that is Pareto-optimal over (departure, transfers, waiting time at
+    transfer stops), arriving at most window minutes before arrival.
+
+    Returns the journeys ranked best first, at most limit of them.
+    """
+    return _pareto_search(network, target, source, arrival, max_transfers,
+                          transfer_buffer, window, limit, reverse=True)
+
+
+def _pareto_search(network, origin, goal, start, max_transfers, transfer_buffer, window, limit, reverse):
+    """
+    Shared forward/reverse McRAPTOR. Times are mapped to keys where smaller is
+    better (the minute forwards, minus the minute in reverse) so both
+    directions share one dominance test. A label is
+    (key, wait, slack, round, parent) where slack is the key of the origin-side
+    trip time: leaving source later (or reaching target earlier) is not
+    counted as waiting, but it decides how long the rider waits at transfers.
+    """
+    if origin == goal:
+        return []
+
+    sign = -1 if reverse else 1
+    start_key = sign * start
+    horizon = start_key + window if window is not None else float('inf')
+
+    origin_label = (start_key, 0, 0, -1, None)
+    # stop -> labels across all rounds, none dominating another
+    bags = {origin: [origin_label]}
+    previous = {origin: [origin_label]}
+
+    for rnd in range(max_transfers + 1):
+        # Each route is scanned once, from the first marked stop in travel direction
+        queue = {}
+        for stop in previous:
+            for route, positions in network.routes_at(stop):
+                first = positions[-1] if reverse else positions[0]
+                if route.name not in queue or sign * first < sign * queue[route.name][1]:
+                    queue[route.name] = (route, first)
+
+        current = {}
+        for route, first_position in queue.values():
+            positions = range(first_position, -1, -1) if reverse else range(first_position, len(route.stops))
+            # (trip, wait, slack, boarding position, label boarded from)
+            route_bag = []
+
+            for position in positions:
+                stop = route.stops[position]
+
+                for trip, wait, slack, board_position, boarded_from in route_bag:
+                    if stop == origin:
+                        break
+                    key = sign * route.time_at(trip, position)
+                    label = (key, wait, slack, rnd, (route, trip, board_position, position, boarded_from))
+                    if _dominated(label, bags.get(goal, ())):
+                        continue
+                    if _merge(bags.setdefault(stop, []), label):
+                        current.setdefault(stop, []).append(label)
+
+                for label in previous.get(stop, ()):
+                    for trip in _boardable_trips(route, position, label, start, horizon, sign, transfer_buffer):
+                        trip_key = sign * route.time_at(trip, position)
+                        if label[3] < 0:
+                            wait, slack = 0, -trip_key
+                        else:
+                            wait, slack = label[1] + trip_key - label[0], label[2]
+                        _merge_route(route_bag, (trip, wait, slack, position, label), sign)
+
+        if not current:
+            break
+        previous = current
+
+    return _ranked_journeys(bags.get(goal, ()), reverse, limit)
+
+
+def _boardable_trips(route, position, label, start, horizon, sign, transfer_buffer):
+    """Trips to try from label: every trip inside the window at the origin, else only the first catchable one"""
+    if label[3] < 0:
+        if sign > 0:
+            trip = route.earliest_trip(position, start)
+            while trip is not None and trip < len(route) and route.time_at(trip, position) <= horizon:
+                yield trip
+                trip += 1
+        else:
+            trip = route.latest_trip(position, start)
+            while trip is not None and trip >= 0 and -route.time_at(trip, position) <= horizon:
+                yield trip
+                trip -= 1
+        return
+
+    if sign > 0:
+        trip = route.earliest_trip(position, label[0] + transfer_buffer)
+    else:
+        trip = route.latest_trip(position, -label[0] - transfer_buffer)
+    if trip is not None:
+        yield trip
+
+
+def _dominated(label, bag):
+    return any(
+        other[0] <= label[0] and other[1] <= label[1] and other[2] <= label[2]
+        for other in bag
+    )
+
+
+def _merge(bag, label):
+    """Add label to bag unless dominated; drop same-or-later round labels it dominates"""
+    if _dominated(label, bag):
+        return False
+    bag[:] = [
+        other for other in bag
+        if other[3] < label[3]
+        or not (label[0] <= other[0] and label[1] <= other[1] and label[2] <= other[2])
+    ]
+    bag.append(label)
+    return True
+
+
+def _merge_route(route_bag, entry, sign):
+    """Add a boarded trip unless an earlier (forwards) or later (reverse) trip is as good"""
+    trip, wait, slack = entry[:3]
+    for other in route_bag:
+        if sign * other[0] <= sign * trip and other[1] <= wait and other[2] <= slack:
+            return
+    route_bag[:] = [
+        other for other in route_bag
+        if not (sign * trip <= sign * other[0] and wait <= other[1] and slack <= other[2])
+    ]
+    route_bag.append(entry)
+
+
+def _ranked_journeys(labels, reverse, limit):
+    """Journeys for the Pareto set over (time, transfers, wait), best first"""
+    best = {}
+    for label in labels:
+        key, wait, slack, rnd, _ = label
+        # Equal on every criterion: keep the shortest overall trip
+        criteria = (key, rnd, wait)
+        if criteria not in best or slack < best[criteria][2]:
+            best[criteria] = label
+
+    front = [
+        label for criteria, label in best.items()
+        if not any(
+            other != criteria and all(o <= c for o, c in zip(other, criteria))
+            for other in best
+        )
+    ]
+    front.sort(key=lambda label: (label[0], label[3], label[1], label[2]))
+    if limit is not None:
+        front = front[:limit]
+
+    journeys = []
+    for label in front:
+        legs = []
+        node = label
+        while node[4] is not None:
+            route, trip, board_position, alight_position, node = node[4]
+            if reverse:
+                legs.append(_leg(route, trip, alight_position, board_position))
+            else:
+                legs.append(_leg(route, trip, board_position, alight_position))
+        if not reverse:
+            legs.reverse()
+        journey = _journey(legs)
+        journey['wait'] = label[1]
+        journeys.append(journey)
+    return journeys
+
+
+def connection_scan(connections, source, target, departure, transfer_buffer=TRANSFER_BUFFER):
+    """
+    Connection Scan Algorithm: earliest arrival at target leaving source at
+    or after departure, in one pass over the departure-sorted connections.
+
+    Returns a single journey, or None if target cannot be reached that day.
+    """
+    source_id = connections.stop_ids.get(source)
+    target_id = connections.stop_ids.get(target)
+    if source_id is None or target_id is None or source_id == target_id:
+        return None
+
+    via = _scan_forward(connections, source_id, departure, transfer_buffer, target_id)
+    if target_id not in via:
+        return None
+    return _scanned_forward_journey(connections, via, source_id, target_id)
+
+
+def earliest_arrivals_from(connections, source, departure, transfer_buffer=TRANSFER_BUFFER):
+    """
+    One-to-all connection scan: the earliest-arrival journey from source to
+    every reachable stop, leaving at or after departure.
+
+    Returns {stop: journey}.
+    """
+    source_id = connections.stop_ids.get(source)
+    if source_id is None:
+        return {}
+
+    via = _scan_forward(connections, source_id, departure, transfer_buffer)
+    return {
+        connections.stops[stop_id]: _scanned_forward_journey(connections, via, source_id, stop_id)
+        for stop_id in via if stop_id != source_id
+    }
+
+
+def latest_departures_to(connections, target, arrival, transfer_buffer=TRANSFER_BUFFER):
+    """
+    All-to-one backward connection scan: the latest-departure journey from
+    every stop that still reaches target by arrival, in one pass over the
+    connections in descending arrival order.
+
+    Returns {stop: journey}.
+    """
+    target_id = connections.stop_ids.get(target)
+    if target_id is None:
+        return {}
+
+    departures = connections.departures
+    arrivals = connections.arrivals
+    trip_ids = connections.trip_ids
+    from_stops = connections.from_stops
+    to_stops = connections.to_stops
+    order = connections.arrival_order
+
+    unreached = float('-inf')
+    # Latest departure from each stop, and the minute a rider must be there by
+    departure = [unreached] * len(connections.stops)
+    deadline = [unreached] * len(connections.stops)
+    deadline[target_id] = arrival
+
+    # trip id -> connection where it is left
+    alighted = {}
+    # stop id -> (boarding connection, alighting connection) of the best departure
+    via = {}
+
+    for rank in range(bisect_right(connections.sorted_arrivals, arrival) - 1, -1, -1):
+        conn = order[rank]
+
+        trip_id = trip_ids[conn]
+        if trip_id not in alighted:
+            if arrivals[conn] > deadline[to_stops[conn]]:
+                continue
+            alighted[trip_id] = conn
+
+        from_stop = from_stops[conn]
+        if departures[conn] > departure[from_stop]:
+            departure[from_stop] = departures[conn]
+            deadline[from_stop] = max(deadline[from_stop], departures[conn] - transfer_buffer)
+            via[from_stop] = (conn, alighted[trip_id])
+
+    journeys = {}
+    for source_id in via:
+        if source_id == target_id:
+            continue
+        legs = []
+        stop = source_id
+        while stop != target_id:
+            enter, leave = via[stop]
+            route, trip = connections.trips[trip_ids[enter]]
+            legs.append(_leg(route, trip, connections.positions[enter], connections.positions[leave] + 1))
+            stop = to_stops[leave]
+        journeys[connections.stops[source_id]] = _journey(legs)
+    return journeys
+
+
+def profile_scan(connections, source, target, transfer_buffer=TRANSFER_BUFFER):
+    """
+    Profile Connection Scan: every journey from source to target over the
+    whole service day that is Pareto-optimal in (departure, arrival), in one
+    pass over the connections in descending departure order.
+
+    Returns the journeys ordered by departure.
+    """
+    source_id = connections.stop_ids.get(source)
+    target_id = connections.stop_ids.get(target)
+    if source_id is None or target_id is None or source_id == target_id:
+        return []
+
+    departures = connections.departures
+    arrivals = connections.arrivals
+    trip_ids = connections.trip_ids
+    from_stops = connections.from_stops
+    to_stops = connections.to_stops
+
+    unreached = float('inf')
+    # trip id -> (arrival at target staying on board from here, connection to leave by)
+    seated = {}
+    # stop id -> entries (minus departure, arrival, boarding connection, leaving connection);
+    # appended in descending departure, so minus departure ascends for bisect
+    profiles = [[] for _ in connections.stops]
+    keys = [[] for _ in connections.stops]
+
+    def earliest_from(stop, ready):
+        """Entry with the earliest arrival leaving stop at or after ready, or None"""
+        idx = bisect_right(keys[stop], -ready) - 1
+        return profiles[stop][idx] if idx >= 0 else None
+
+    for conn in range(len(departures) - 1, -1, -1):
+        trip_id = trip_ids[conn]
+        to_stop = to_stops[conn]
+
+        # Stay on, get off at the target, or change buses at the next stop
+        best, leave = seated.get(trip_id, (unreached, None))
+        if to_stop == target_id:
+            if arrivals[conn] < best:
+                best, leave = arrivals[conn], conn
+        else:
+            entry = earliest_from(to_stop, arrivals[conn] + transfer_buffer)
+            if entry is not None and entry[1] < best:
+                best, leave = entry[1], conn
+        if leave is None:
+            continue
+        seated[trip_id] = (best, leave)
+
+        from_stop = from_stops[conn]
+        if from_stop == target_id:
+            continue
+        profile = profiles[from_stop]
+        if profile and best >= profile[-1][1]:
+            continue
+        if profile and profile[-1][0] == -departures[conn]:
+            profile.pop()
+            keys[from_stop].pop()
+        profile.append((-departures[conn], best, conn, leave))
+        keys[from_stop].append(-departures[conn])
+
+    journeys = []
+    for _, _, enter, leave in reversed(profiles[source_id]):
+        legs = []
+        while True:
+            route, trip = connections.trips[trip_ids[enter]]
+            legs.append(_leg(route, trip, connections.positions[enter], connections.positions[leave] + 1))
+            stop = to_stops[leave]
+            if stop == target_id:
+                break
+            _, _, enter, leave = earliest_from(stop, arrivals[leave] + transfer_buffer)
+        journeys.append(_journey(legs))
+    return journeys
+
+
+def next_departures(network, stop, after, count=10):
+    """
+    The next count departures from stop at or after minute after, across
+    every route and every visit of a looping route. Each route position is
+    a sorted run of trip times (departure plus the stop's offset), so the
+    runs are merged lazily with a heap and only count trips are touched.
+    """
+    heap = []
+    for route, positions in network.routes_at(stop):
+        for position in positions:
+            # A trip ends at its last stop, it does not depart from there
+            if position == len(route.stops) - 1:
+                continue
+            trip = route.earliest_trip(position, after)
+            if trip is not None:
+                heap.append((route.time_at(trip, position), route.name, position, trip, route))
+    heapq.heapify(heap)
+
+    departures = []
+    while heap and len(departures) < count:
+        minute, _, position, trip, route = heapq.heappop(heap)
+        departures.append({
+            'route': route.name,
+            'bus': route.buses[trip],
+            'departure': minute,
+            'next_stop': route.stops[position + 1],
+            'towards': route.stops[-1]
+        })
+        if trip + 1 < len(route):
+            heapq.heappush(heap, (route.time_at(trip + 1, position), route.name, position, trip + 1, route))
+    return departures
+
+
+def direct_rides(network, source, target):
+    """
+    Single-bus rides from source to target as (route, board position, alight
+    position), alighting at the first visit of target after each boarding
+    position. A trip ends at its route's last stop, so a looping route that
+    only reaches target by wrapping past it is left to the transfer planners.
+    """
+    rides = []
+    for route, positions in network.routes_at(source):
+        alight_positions = network.stop_index.positions_on(target, route.name)
+        for board_position in positions:
+            alight_index = bisect_right(alight_positions, board_position)
+            if alight_index < len(alight_positions):
+                rides.append((route, board_position, alight_positions[alight_index]))
+    return rides
+
+
+def direct_journey(route, trip, board_position, alight_position):
+    """Journey dict, as the planners return, for riding trip between two positions"""
+    return _journey([_leg(route, trip, board_position, alight_position)])
+
+
+def _scan_forward(connections, source_id, departure, transfer_buffer, target_id=None):
+    """
+    Forward connection scan from source_id. Stops early once nothing can
+    improve target_id, if given. Returns {stop id: (boarding connection,
+    alighting connection)} for every improved stop.
+    """
+    departures = connections.departures
+    arrivals = connections.arrivals
+    trip_ids = connections.trip_ids
+    from_stops = connections.from_stops
+    to_stops = connections.to_stops
+
+    unreached = float('inf')
+    # Earliest arrival at each stop, and the minute a rider can board there
+    arrival = [unreached] * len(connections.stops)
+    ready = [unreached] * len(connections.stops)
+    ready[source_id] = departure
+
+    # trip id -> connection where it was boarded
+    boarded = {}
+    # stop id -> (boarding connection, alighting connection) of the best arrival
+    via = {}
+
+    for conn in range(bisect_left(departures, departure), len(departures)):
+        if target_id is not None and departures[conn] >= arrival[target_id]:
+            break
+
+        trip_id = trip_ids[conn]
+        if trip_id not in boarded:
+            if ready[from_stops[conn]] > departures[conn]:
+                continue
+            boarded[trip_id] = conn
+
+        to_stop = to_stops[conn]
+        if arrivals[conn] < arrival[to_stop]:
+            arrival[to_stop] = arrivals[conn]
+            ready[to_stop] = min(ready[to_stop], arrivals[conn] + transfer_buffer)
+            via[to_stop] = (boarded[trip_id], conn)
+
+    return via
+
+
+def _scanned_forward_journey(connections, via, source_id, target_id):
+    """Follow forward scan labels back from target_id to source_id"""
+    legs = []
+    stop = target_id
+    while stop != source_id:
+        enter, leave = via[stop]
+        route, trip = connections.trips[connections.trip_ids[enter]]
+        legs.append(_leg(route, trip, connections.positions[enter], connections.positions[leave] + 1))
+        stop = connections.from_stops[enter]
+    legs.reverse()
+    return _journey(legs)
+
+
+def _leg(route, trip, board_position, alight_position):
+    return {
+        'route': route.name,
+        'bus': route.buses[trip],
+        'board_stop': route.stops[board_position],
+        'alight_stop': route.stops[alight_position],
+        'departure': route.time_at(trip, board_position),
+        'arrival': route.time_at(trip, alight_position),
+        'stops': list(route.stops[board_position:alight_position + 1])
+    }
+
+
+def _journey(legs):
+    return {
+        'departure': legs[0]['departure'],
+        'arrival': legs[-1]['arrival'],
+        'transfers': len(legs) - 1,
+        'legs': legs
+    }
+
+
+def _forward_journey(rounds, rnd, target):
+    """Follow earliest-arrival labels back from target to the source"""
+    legs = []
+    stop = target
+    while rnd >= 0:
+        _, route, trip, board_position, alight_position, board_round = rounds[rnd][stop]
+        legs.append(_leg(route, trip, board_position, alight_position))
+        stop = route.stops[board_position]
+        rnd = board_round
+    legs.reverse()
+    return _journey(legs)
+
+
+def _reverse_journey(rounds, rnd, source):
+    """Follow latest-departure labels forward from source to the target"""
+    legs = []
+    stop = source
+    while rnd >= 0:
+        _, route, trip, board_position, alight_position, alight_round = rounds[rnd][stop]
+        legs.append(_leg(route, trip, board_position, alight_position))
+        stop = route.stops[alight_position]
+        rnd = alight_round
+    return _journey(legs)
+
+
+def format_journey(journey, fmt='%I:%M %p', day_labels=False):
+    """
+    Copy of a journey with display strings in place of minute values.
+    departure_day and arrival_day give the day relative to the travel date
+    (-1, 0 or 1); day_labels also notes it in each display string.
+    """
+    formatter = format_day_minutes if day_labels else format_minutes
+    return {
+        **journey,
+        'departure': formatter(journey['departure'], fmt),
+        'arrival': formatter(journey['arrival'], fmt),
+        'departure_day': int(journey['departure'] // DAY_MINUTES),
+        'arrival_day': int(journey['arrival'] // DAY_MINUTES),
+        'legs': [
+            {**leg,
+             'departure': formatter(leg['departure'], fmt),
+             'arrival': formatter(leg['arrival'], fmt)}
+            for leg in journey['legs']
+        ]
+    }
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class OptimizationJob:
+    """One background optimizer run, with the progress it has reported so far"""
+
+    def __init__(self, kind, parameters):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.parameters = parameters
+        self.status = 'queued'
+        self.generation = 0
+        self.generations = parameters.get('generations')
+        self.best_fitness = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._started = None
+
+    def report(self, generation, generations, best_fitness):
+        """Progress callback passed to BusScheduleOptimizer.optimize"""
+        self.generation = generation
+        self.generations = generations
+        self.best_fitness = best_fitness
+
+    def eta_seconds(self):
+        """Seconds left at the average pace so far, None before the first generation"""
+        if self.status != 'running' or not self.generation or not self.generations:
+            return None
+        elapsed = time.monotonic() - self._started
+        return round(elapsed / self.generation * (self.generations - self.generation), 1)
+
+    def to_dict(self, include_result=True):
+        job = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'parameters': self.parameters,
+            'generation': self.generation,
+            'generations': self.generations,
+            'best_fitness': self.best_fitness,
+            'eta_seconds': self.eta_seconds(),
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error
+        }
+        if include_result:
+            job['result'] = self.result
+        return job
+
+
+class JobRunner:
+    """
+    Runs optimizer jobs on background threads so HTTP requests return at once.
+    Finished jobs are kept for polling until max_jobs newer ones push them out.
+    """
+
+    FINISHED = ('completed', 'failed', 'cancelled')
+
+    def __init__(self, max_workers=1, max_jobs=100):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='optimization-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, parameters, run):
+        """
+        Queue run(job) and return the job. run gets the job for its report
+        callback and cancel_event, and returns the result to keep.
+        """
+        job = OptimizationJob(kind, parameters)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Ask a job to stop after its current generation; None if unknown"""
+        job = self.get(job_id)
+        if job is not None and job.status not in self.FINISHED:
+            job.cancel_event.set()
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished_at = datetime.now()
+        return job
+
+    def _run(self, job, run):
+        if job.cancel_event.is_set():
+            return
+
+        job.status = 'running'
+        job.started_at = datetime.now()
+        job._started = time.monotonic()
+        try:
+            result = run(job)
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+            elif result is None:
+                job.status = 'failed'
+                job.error = 'Optimization failed to produce valid results'
+            else:
+                job.result = result
+                job.status = 'completed'
+        except Exception as e:
+            logging.error(f"Optimization job {job.id} failed: {str(e)}")
+            logging.error(traceback.format_exc())
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in self.FINISHED]
+        while len(self._jobs) > self.max_jobs and finished:
+            del self._jobs[finished.pop(0)]
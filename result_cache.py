@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a time-to-live for journey results. Keys carry
+    the timetable version, so a route or schedule write makes old entries
+    unreachable and they age out through LRU eviction or the TTL.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=300, bucket_minutes=1):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # Width of the desired-time bucket; 1 keeps answers exact to the minute
+        self.bucket_minutes = bucket_minutes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def time_bucket(self, value):
+        """Bucket of a time/datetime, as minutes since midnight // bucket_minutes"""
+        return (value.hour * 60 + value.minute) // self.bucket_minutes
+
+    def get(self, key):
+        """Cached value for key, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for tuning max_size, ttl_seconds and bucket_minutes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'bucket_minutes': self.bucket_minutes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,50 @@
+import random
+import unittest
+
+import numpy as np
+
+from admin_optimizer import build_fleet_optimizer
+
+BUS_DATA = {
+    'Route A': {
+        'stops': ['Stop 1', 'Stop 2', 'Stop 3', 'Stop 1'],
+        'buses': {
+            'Bus 1': {'weekdays': [420, 480, 540], 'friday': [420, 480], 'weekends': []},
+            'Bus 2': {'weekdays': [450, 510], 'friday': [450], 'weekends': [600]}
+        }
+    },
+    'Route B': {
+        'stops': ['Stop 2', 'Stop 4', 'Stop 5'],
+        'buses': {
+            'Bus 1': {'weekdays': [430, 530], 'friday': [430], 'weekends': [630]}
+        }
+    }
+}
+
+
+class EmptyDemandLogTest(unittest.TestCase):
+    """With no trip requests there are no peak hours, which used to divide by zero"""
+
+    def setUp(self):
+        self.optimizer = build_fleet_optimizer(BUS_DATA, [], {'Route A': 2, 'Route B': 1})
+
+    def test_population_scores_without_peak_hours(self):
+        population = [self.optimizer._create_individual() for _ in range(4)]
+        fitness = self.optimizer._evaluate_population(population)
+
+        self.assertTrue(np.all(np.isfinite(fitness)))
+        for individual, score in zip(population, fitness):
+            self.assertEqual(individual['fitness_metrics']['peak_coverage'], 0)
+            self.assertAlmostEqual(self.optimizer._calculate_fitness(individual), score)
+
+    def test_optimize_runs_on_empty_trip_log(self):
+        random.seed(0)
+        result = self.optimizer.optimize(population_size=6, generations=2)
+
+        self.assertIsNotNone(result)
+        self.assertEqual(result['fitness_metrics']['peak_coverage'], 0)
+        self.assertEqual(set(result['optimized_fleet']), set(BUS_DATA))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import itertools
+import unittest
+
+from journey_planner import (
+    earliest_arrival, latest_departure, connection_scan, latest_departures_to, profile_scan
+)
+from timetable import CompiledTimetable, shortest_segment, travel_minutes
+
+# Loop routes repeat their terminal stop; Route C also passes Stop 2 twice
+BUS_DATA = {
+    'Route A': {
+        'stops': ['Stop 1', 'Stop 2', 'Stop 3', 'Stop 4', 'Stop 1'],
+        'buses': {
+            'Bus 1': {'weekdays': [420, 480, 540], 'friday': [], 'weekends': []},
+            'Bus 2': {'weekdays': [450, 510], 'friday': [], 'weekends': []}
+        }
+    },
+    'Route B': {
+        'stops': ['Stop 3', 'Stop 5', 'Stop 6', 'Stop 3'],
+        'buses': {
+            'Bus 1': {'weekdays': [430, 500], 'friday': [], 'weekends': []},
+            'Bus 2': {'weekdays': [460, 530], 'friday': [], 'weekends': []}
+        }
+    },
+    'Route C': {
+        'stops': ['Stop 6', 'Stop 2', 'Stop 7', 'Stop 8', 'Stop 2', 'Stop 6'],
+        'buses': {
+            'Bus 1': {'weekdays': [440, 520], 'friday': [], 'weekends': []}
+        }
+    }
+}
+
+STOPS = ['Stop 1', 'Stop 2', 'Stop 3', 'Stop 4', 'Stop 5', 'Stop 6', 'Stop 7', 'Stop 8']
+
+
+class PlannerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.timetable = CompiledTimetable(BUS_DATA)
+        self.network = self.timetable.networks['weekdays']
+        self.connections = self.timetable.connections['weekdays']
+
+
+class RaptorMatchesConnectionScanTest(PlannerTestCase):
+    """RAPTOR and the connection scan answer the same queries with the same times"""
+
+    def test_earliest_arrival(self):
+        for source, target in itertools.permutations(STOPS, 2):
+            for departure in range(400, 600, 7):
+                journeys = earliest_arrival(self.network, source, target, departure)
+                expected = connection_scan(self.connections, source, target, departure)
+                with self.subTest(source=source, target=target, departure=departure):
+                    if expected is None:
+                        self.assertEqual(journeys, [])
+                    else:
+                        self.assertAlmostEqual(min(j['arrival'] for j in journeys), expected['arrival'])
+
+    def test_latest_departure(self):
+        for target in STOPS:
+            for arrival in range(420, 640, 7):
+                expected = latest_departures_to(self.connections, target, arrival)
+                for source in STOPS:
+                    if source == target:
+                        continue
+                    journeys = latest_departure(self.network, source, target, arrival)
+                    with self.subTest(source=source, target=target, arrival=arrival):
+                        if source not in expected:
+                            self.assertEqual(journeys, [])
+                        else:
+                            self.assertAlmostEqual(
+                                max(j['departure'] for j in journeys), expected[source]['departure']
+                            )
+
+
+class ProfileScanTest(PlannerTestCase):
+
+    def test_profile_is_pareto_optimal(self):
+        for source, target in itertools.permutations(STOPS, 2):
+            journeys = profile_scan(self.connections, source, target)
+            with self.subTest(source=source, target=target):
+                # Ordered by departure, so no journey may arrive at or after a later one
+                for earlier, later in zip(journeys, journeys[1:]):
+                    self.assertLess(earlier['departure'], later['departure'])
+                    self.assertLess(earlier['arrival'], later['arrival'])
+
+                # Nothing leaving at the same time arrives any earlier
+                for journey in journeys:
+                    best = connection_scan(self.connections, source, target, journey['departure'])
+                    self.assertAlmostEqual(journey['arrival'], best['arrival'])
+
+    def test_profile_covers_every_departure(self):
+        # Every journey the connection scan finds is matched or beaten by the profile
+        journeys = profile_scan(self.connections, 'Stop 1', 'Stop 6')
+        for departure in range(400, 600, 5):
+            best = connection_scan(self.connections, 'Stop 1', 'Stop 6', departure)
+            if best is None:
+                continue
+            options = [j['arrival'] for j in journeys if j['departure'] >= departure]
+            self.assertAlmostEqual(min(options), best['arrival'])
+
+
+class LoopingRouteTest(PlannerTestCase):
+    """A stop visited twice on a route is ridden from the visit closest to the destination"""
+
+    def test_segment_uses_shortest_visit_pair(self):
+        stop_index = self.timetable.stop_index
+
+        self.assertEqual(stop_index.positions_on('Stop 2', 'Route C'), (1, 4))
+        self.assertEqual(stop_index.segment('Route C', 'Stop 2', 'Stop 6'), (4, 5))
+        self.assertEqual(stop_index.segment('Route C', 'Stop 7', 'Stop 2'), (2, 4))
+        self.assertEqual(shortest_segment([1, 4], [5], 6), (4, 5))
+
+    def test_stops_and_travel_time_follow_the_segment(self):
+        self.assertEqual(self.timetable.stops_between('Route C', 'Stop 2', 'Stop 6'), ['Stop 2', 'Stop 6'])
+        self.assertEqual(
+            self.timetable.stops_between('Route C', 'Stop 7', 'Stop 2'), ['Stop 7', 'Stop 8', 'Stop 2']
+        )
+        self.assertAlmostEqual(self.timetable.travel_time('Route C', 'Stop 2', 'Stop 6'), travel_minutes(1))
+        self.assertAlmostEqual(self.timetable.travel_time('Route C', 'Stop 7', 'Stop 2'), travel_minutes(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
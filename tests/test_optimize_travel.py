@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime
+
+from app import plan_home_trip, day_types_around
+from genetic_algorithm import optimize_user_travel, calculate_alternative_route_times
+from journey_planner import pareto_latest_departure, format_journey
+from timetable import CompiledTimetable
+
+# Loop routes: a trip leaves the first stop at its departure minute and
+# reaches position k travel_minutes(k) later
+BUS_DATA = {
+    'Route A': {
+        'stops': ['Stop 1', 'Stop 2', 'Stop 3', 'Stop 4', 'Stop 5', 'Stop 1'],
+        'buses': {
+            'Bus 1': {'weekdays': [420, 500], 'friday': [], 'weekends': []},
+            'Bus 2': {'weekdays': [453], 'friday': [], 'weekends': []}
+        }
+    },
+    'Route B': {
+        'stops': ['Stop 6', 'Stop 3', 'Stop 4', 'Stop 5', 'Stop 6'],
+        'buses': {
+            'Bus 1': {'weekdays': [400, 480], 'friday': [], 'weekends': []}
+        }
+    }
+}
+
+
+class DirectTripAgreementTest(unittest.TestCase):
+    """/optimize_travel and the home page must time the same trip the same way"""
+
+    def setUp(self):
+        self.timetable = CompiledTimetable(BUS_DATA)
+        # A Monday, 08:00
+        self.travel_datetime = datetime(2026, 10, 19, 8, 0)
+
+    def test_optimize_travel_matches_home_page(self):
+        result = optimize_user_travel(
+            BUS_DATA, self.travel_datetime, 'Stop 3', 'Stop 5', timetable=self.timetable
+        )
+        message, _, context = plan_home_trip(
+            self.timetable, 'Stop 3', 'Stop 5', self.travel_datetime,
+            day_types_around(self.travel_datetime.date())
+        )
+
+        self.assertIsNone(message)
+        self.assertEqual(result['route'], context['bus_group'])
+        self.assertEqual(result['bus'], context['bus_name'])
+        self.assertEqual(result['stops'], context['route_stops'])
+        self.assertEqual(
+            result['departure_time'],
+            datetime.strptime(context['optimized_plan'][0], '%I:%M %p').strftime('%H:%M')
+        )
+        self.assertEqual(
+            result['arrival_time'],
+            datetime.strptime(context['actual_arrival'], '%I:%M %p').strftime('%H:%M')
+        )
+
+    def test_departure_is_time_at_boarding_stop(self):
+        result = optimize_user_travel(
+            BUS_DATA, self.travel_datetime, 'Stop 3', 'Stop 5', timetable=self.timetable
+        )
+
+        # Bus 2 leaves Stop 1 at 07:33 and reaches Stop 3 two stops later
+        self.assertEqual(result['route'], 'Route A')
+        self.assertEqual(result['departure_time'], '07:41')
+        self.assertEqual(result['arrival_time'], '07:50')
+        self.assertEqual(result['travel_time'], 8.6)
+
+
+class TransferTimingTest(unittest.TestCase):
+    """Both legs of a transfer are timed at their boarding and alighting stops"""
+
+    def test_legs_follow_trip_times(self):
+        combo = {
+            'first_route': 'Route A',
+            'second_route': 'Route B',
+            'transfer_stop': 'Stop 3',
+            'starting_point': 'Stop 2',
+            'destination': 'Stop 6'
+        }
+        times = calculate_alternative_route_times(
+            BUS_DATA, combo, datetime(2026, 10, 19, 9, 0), 'weekdays',
+            timetable=CompiledTimetable(BUS_DATA)
+        )
+
+        # Route A's 07:33 trip passes Stop 2 at 07:37 and Stop 3 at 07:41;
+        # Route B's 08:00 trip passes Stop 3 at 08:04 and reaches Stop 6 at 08:17
+        self.assertEqual(times['first_departure'], '07:37')
+        self.assertEqual(times['transfer_time'], '07:41')
+        self.assertEqual(times['second_departure'], '08:04')
+        self.assertEqual(times['final_arrival'], '08:17')
+
+    def test_optimize_travel_offers_mcraptor_journeys(self):
+        timetable = CompiledTimetable(BUS_DATA)
+        result = optimize_user_travel(
+            BUS_DATA, datetime(2026, 10, 19, 9, 0), 'Stop 2', 'Stop 6', timetable=timetable
+        )
+        journeys = pareto_latest_departure(timetable.networks['weekdays'], 'Stop 2', 'Stop 6', 540, limit=3)
+
+        self.assertEqual(result['route_type'], 'alternative')
+        self.assertEqual(len(result['alternatives']), len(journeys) - 1)
+        self.assertEqual(result['legs'], format_journey(journeys[0], '%H:%M')['legs'])
+        self.assertEqual(result['times']['final_arrival'], '08:17')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,520 @@
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+DAY_TYPES = ('weekdays', 'friday', 'weekends')
+
+DAY_MINUTES = 24 * 60
+
+# How far into the previous and next day a rolling timetable reaches; half a
+# day bridges the overnight gap between the last and first buses
+ROLLOVER_MINUTES = 12 * 60
+
+
+def to_minutes(value):
+    """Convert an 'HH:MM' string or a time/datetime to minutes since midnight"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        hours, minutes = value.split(':')
+        return int(hours) * 60 + int(minutes)
+    return value.hour * 60 + value.minute
+
+
+def minutes_to_time(minutes):
+    """Convert minutes since midnight back to a time object"""
+    return (datetime.min + timedelta(minutes=minutes % (24 * 60))).time()
+
+
+def format_minutes(minutes, fmt='%H:%M'):
+    """Format minutes since midnight for templates and JSON responses"""
+    return minutes_to_time(minutes).strftime(fmt)
+
+
+def format_day_minutes(minutes, fmt='%I:%M %p'):
+    """format_minutes, noting when minutes fall on the previous or next day"""
+    text = format_minutes(minutes, fmt)
+    if minutes < 0:
+        return f"{text} (previous day)"
+    if minutes >= DAY_MINUTES:
+        return f"{text} (next day)"
+    return text
+
+
+def travel_minutes(num_stops):
+    """In-vehicle minutes for num_stops hops: 3.5 per stop plus a traffic buffer capped at 15"""
+    return num_stops * 3.5 + min(num_stops * 0.8, 15)
+
+
+def hop_count(start_idx, end_idx, total_stops):
+    """Stops travelled from start_idx to end_idx, wrapping around a circular route"""
+    return end_idx - start_idx if start_idx < end_idx else total_stops - start_idx + end_idx
+
+
+def shortest_segment(starts, ends, total_stops):
+    """
+    (start_idx, end_idx) with the fewest hops over every occurrence of the two
+    stops on a looping route, earliest boarding on ties; None if either is missing
+    """
+    best = None
+    for start_idx in starts:
+        for end_idx in ends:
+            hops = hop_count(start_idx, end_idx, total_stops)
+            if best is None or hops < best[0]:
+                best = (hops, start_idx, end_idx)
+    return best[1:] if best else None
+
+
+def route_segment(route_stops, start, dest):
+    """
+    shortest_segment over a plain stop list; raises ValueError like
+    list.index when either stop is missing
+    """
+    segment = shortest_segment(
+        [idx for idx, stop in enumerate(route_stops) if stop == start],
+        [idx for idx, stop in enumerate(route_stops) if stop == dest],
+        len(route_stops)
+    )
+    if segment is None:
+        raise ValueError(f"{start} or {dest} is not on the route")
+    return segment
+
+
+class DepartureIndex:
+    """Departures of one route on one day type, sorted by minute of day"""
+
+    def __init__(self, entries=()):
+        entries = sorted(entries)
+        # Minutes since midnight as int16, the compact time type used end to end
+        self.minutes = array('h', (minute for minute, _ in entries))
+        # Owning bus of each departure, parallel to self.minutes
+        self.buses = tuple(bus for _, bus in entries)
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def latest_at_or_before(self, minute):
+        """Index of the last departure at or before minute, or None"""
+        idx = bisect_right(self.minutes, minute) - 1
+        return idx if idx >= 0 else None
+
+    def first_at_or_after(self, minute):
+        """Index of the first departure at or after minute, or None"""
+        idx = bisect_left(self.minutes, minute)
+        return idx if idx < len(self.minutes) else None
+
+
+class StopIndex:
+    """Inverted index from a stop to the routes serving it and its positions on each"""
+
+    def __init__(self, bus_data):
+        # Route order of bus_data, so "first matching route" stays stable
+        self.route_rank = {route_name: rank for rank, route_name in enumerate(bus_data)}
+
+        positions = defaultdict(lambda: defaultdict(list))
+        for route_name, route_data in bus_data.items():
+            for position, stop in enumerate(route_data.get('stops', [])):
+                positions[stop][route_name].append(position)
+
+        # stop -> {route: (position, ...)} with every occurrence on looping routes
+        self.positions = {
+            stop: {route_name: tuple(idxs) for route_name, idxs in routes.items()}
+            for stop, routes in positions.items()
+        }
+        # stop -> frozenset of routes serving it
+        self.routes = {stop: frozenset(routes) for stop, routes in self.positions.items()}
+        self.route_lengths = {
+            route_name: len(route_data.get('stops', [])) for route_name, route_data in bus_data.items()
+        }
+
+    def routes_serving(self, stop):
+        """Routes serving stop, in bus_data order"""
+        return self._ordered(self.routes.get(stop, frozenset()))
+
+    def common_routes(self, start, dest):
+        """Routes serving both start and dest, in bus_data order"""
+        return self._ordered(
+            self.routes.get(start, frozenset()) & self.routes.get(dest, frozenset())
+        )
+
+    def positions_on(self, stop, route_name):
+        """Every position of stop on route_name, empty if the route skips it"""
+        return self.positions.get(stop, {}).get(route_name, ())
+
+    def segment(self, route_name, start, dest):
+        """Shortest (start position, dest position) ride on route_name, or None"""
+        return shortest_segment(
+            self.positions_on(start, route_name),
+            self.positions_on(dest, route_name),
+            self.route_lengths.get(route_name, 0)
+        )
+
+    def _ordered(self, route_names):
+        return sorted(route_names, key=self.route_rank.__getitem__)
+
+
+def normalize_stop_name(name):
+    """Casefolded stop name with surrounding and repeated whitespace removed"""
+    return ' '.join(name.casefold().split())
+
+
+class StopNameIndex:
+    """
+    Prefix trie over normalized stop names for lookups and autocomplete.
+    Every word of a name is indexed, so "peri" finds "Hentian Perindu";
+    matches at the start of the name rank first, then busier stops.
+    """
+
+    def __init__(self, stop_index):
+        # normalized name -> spelling used in bus_data
+        self.names = {}
+        for stop in stop_index.routes:
+            self.names.setdefault(normalize_stop_name(stop), stop)
+
+        # char -> child node; the None key holds the node's matches
+        root = {}
+        for key, stop in self.names.items():
+            display = ' '.join(stop.split())
+            words = key.split(' ')
+            offset = 0
+            for word_number, word in enumerate(words):
+                rank = (word_number > 0, -len(stop_index.routes[stop]), display)
+                node = root
+                for char in key[offset:]:
+                    node = node.setdefault(char, {})
+                    matches = node.setdefault(None, {})
+                    if display not in matches or rank < matches[display]:
+                        matches[display] = rank
+                offset += len(word) + 1
+
+        # Freeze each node's matches into a ranked tuple of display names
+        stack = [root]
+        while stack:
+            for char, child in stack.pop().items():
+                if char is not None:
+                    matches = child[None]
+                    child[None] = tuple(sorted(matches, key=matches.__getitem__))
+                    stack.append(child)
+        self._root = root
+
+    def resolve(self, name):
+        """bus_data spelling of name, matched case- and whitespace-insensitively, or None"""
+        return self.names.get(normalize_stop_name(name))
+
+    def suggest(self, query, limit=10):
+        """Up to limit stop names matching query as a prefix of the name or any word in it"""
+        node = self._root
+        for char in normalize_stop_name(query):
+            node = node.get(char)
+            if node is None:
+                return []
+        return list(node.get(None, ())[:limit])
+
+
+class TravelTimes:
+    """
+    Per-route matrices of in-vehicle minutes between stop positions. A ride
+    from a later position to an earlier one wraps around the circular route.
+    """
+
+    def __init__(self, bus_data):
+        self.matrices = {}
+        for route_name, route_data in bus_data.items():
+            total_stops = len(route_data.get('stops', []))
+            self.matrices[route_name] = tuple(
+                tuple(
+                    travel_minutes(hop_count(start_idx, end_idx, total_stops))
+                    for end_idx in range(total_stops)
+                )
+                for start_idx in range(total_stops)
+            )
+
+    def between(self, route_name, start_idx, end_idx):
+        """Minutes from position start_idx to position end_idx on route_name"""
+        return self.matrices[route_name][start_idx][end_idx]
+
+
+class TransferTable:
+    """
+    Stops shared by each ordered pair of routes, with every position of the
+    stop on both routes, so transfer searches are a lookup instead of set
+    intersections
+    """
+
+    def __init__(self, bus_data, stop_index):
+        pairs = defaultdict(list)
+        for route_name, route_data in bus_data.items():
+            for position, stop in enumerate(route_data.get('stops', [])):
+                # One entry per stop, at its first visit
+                positions = stop_index.positions_on(stop, route_name)
+                if positions[0] != position:
+                    continue
+                for other_route, other_positions in stop_index.positions.get(stop, {}).items():
+                    if other_route != route_name:
+                        pairs[(route_name, other_route)].append((stop, positions, other_positions))
+
+        # (from route, to route) -> ((stop, positions on from route, positions on to route), ...)
+        # in the from route's stop order
+        self.pairs = {pair: tuple(stops) for pair, stops in pairs.items()}
+
+    def between(self, from_route, to_route):
+        """Transfer stops from from_route to to_route, empty if the routes never meet"""
+        return self.pairs.get((from_route, to_route), ())
+
+
+class RouteTrips:
+    """
+    Array form of one route's trips on one day type. Each Schedule row is a
+    trip leaving the route's first stop at its departure time and reaching
+    position k travel_minutes(k) later.
+    """
+
+    def __init__(self, name, stops, departures):
+        self.name = name
+        self.stops = tuple(stops)
+        self.offsets = tuple(travel_minutes(position) for position in range(len(self.stops)))
+        # Trip start times in minutes, sorted, with the bus of each trip
+        self.departures = departures.minutes
+        self.buses = departures.buses
+
+    def __len__(self):
+        return len(self.departures)
+
+    def time_at(self, trip, position):
+        """Minute at which trip passes the stop at position"""
+        return self.departures[trip] + self.offsets[position]
+
+    def earliest_trip(self, position, ready):
+        """First trip passing position at or after ready, or None"""
+        trip = bisect_left(self.departures, ready - self.offsets[position])
+        return trip if trip < len(self.departures) else None
+
+    def latest_trip(self, position, deadline):
+        """Last trip passing position at or before deadline, or None"""
+        trip = bisect_right(self.departures, deadline - self.offsets[position]) - 1
+        return trip if trip >= 0 else None
+
+
+class TransitNetwork:
+    """Routes with trips on one day type, indexed for round-based search"""
+
+    def __init__(self, bus_data, departures, day_type, stop_index):
+        self.day_type = day_type
+        self.stop_index = stop_index
+        self.routes = {}
+        for route_name, route_data in bus_data.items():
+            route_departures = departures.get((route_name, day_type))
+            if route_departures and len(route_data['stops']) > 1:
+                self.routes[route_name] = RouteTrips(route_name, route_data['stops'], route_departures)
+
+    def routes_at(self, stop):
+        """(route, positions) for every route with trips that serves stop"""
+        return [
+            (self.routes[route_name], positions)
+            for route_name, positions in self.stop_index.positions.get(stop, {}).items()
+            if route_name in self.routes
+        ]
+
+
+class ConnectionTable:
+    """
+    Every elementary hop (stop -> next stop) of one day type as flat
+    parallel arrays sorted by departure, for connection scanning
+    """
+
+    def __init__(self, network):
+        # Integer ids for stops so the scan can index plain lists
+        self.stops = tuple(sorted({stop for route in network.routes.values() for stop in route.stops}))
+        self.stop_ids = {stop: stop_id for stop_id, stop in enumerate(self.stops)}
+
+        # trip id -> (RouteTrips, trip index on that route)
+        self.trips = []
+        rows = []
+        for route in network.routes.values():
+            stop_ids = [self.stop_ids[stop] for stop in route.stops]
+            for trip in range(len(route)):
+                trip_id = len(self.trips)
+                self.trips.append((route, trip))
+                for position in range(len(route.stops) - 1):
+                    rows.append((
+                        route.time_at(trip, position),
+                        route.time_at(trip, position + 1),
+                        trip_id,
+                        position,
+                        stop_ids[position],
+                        stop_ids[position + 1]
+                    ))
+        rows.sort()
+
+        self.departures = array('d', (row[0] for row in rows))
+        self.arrivals = array('d', (row[1] for row in rows))
+        self.trip_ids = array('l', (row[2] for row in rows))
+        # Position of the departure stop on the trip's route
+        self.positions = array('l', (row[3] for row in rows))
+        self.from_stops = array('l', (row[4] for row in rows))
+        self.to_stops = array('l', (row[5] for row in rows))
+
+        # Connection indices in arrival order, for backward (arrive-by) scans
+        self.arrival_order = array('l', sorted(range(len(rows)), key=self.arrivals.__getitem__))
+        self.sorted_arrivals = array('d', (self.arrivals[conn] for conn in self.arrival_order))
+
+    def __len__(self):
+        return len(self.departures)
+
+
+class CompiledTimetable:
+    """
+    Read-only snapshot of routes, stops and schedules used by the planners.
+
+    A Schedule's departure_time is when that trip leaves the route's first
+    stop; it passes the stop at position k travel_minutes(k) later (see
+    RouteTrips.time_at). The home page, /api/plan and /optimize_travel,
+    including its genetic search and transfer timings, all read trip times
+    this way; travel_time() only gives in-vehicle minutes between two stops.
+    """
+
+    def __init__(self, bus_data, version=None):
+        self.version = version
+        self.compiled_at = datetime.now()
+
+        # Legacy nested-dict view ({route: {'stops': [...], 'buses': {...}}})
+        # kept for the planners in genetic_algorithm.py and admin_optimizer.py
+        self.bus_data = bus_data
+
+        self.stop_index = StopIndex(bus_data)
+        self.stop_names = StopNameIndex(self.stop_index)
+        self.travel_times = TravelTimes(bus_data)
+        self.transfers = TransferTable(bus_data, self.stop_index)
+
+        # (route, day_type) -> DepartureIndex over every bus on the route
+        self.departures = {}
+        for route_name, route_data in bus_data.items():
+            for day_type in DAY_TYPES:
+                self.departures[(route_name, day_type)] = DepartureIndex(
+                    (to_minutes(departure), bus)
+                    for bus, schedules in route_data['buses'].items()
+                    for departure in schedules.get(day_type, [])
+                )
+
+        # day_type -> TransitNetwork used by journey_planner
+        self.networks = {
+            day_type: TransitNetwork(bus_data, self.departures, day_type, self.stop_index)
+            for day_type in DAY_TYPES
+        }
+
+        # day_type -> ConnectionTable used by the connection scan planner
+        self.connections = {
+            day_type: ConnectionTable(network) for day_type, network in self.networks.items()
+        }
+
+        # (previous, travel, next day_type) -> rolling departures, network and
+        # connections, built on first use; a week needs at most six of them
+        self._rolling = {}
+        self._rolling_lock = threading.Lock()
+
+    def travel_time(self, route_name, start, dest):
+        """In-vehicle minutes from start to dest on route_name, over the best pair of visits"""
+        segment = self.stop_index.segment(route_name, start, dest)
+        if segment is None:
+            raise KeyError(f"{start} or {dest} is not on {route_name}")
+        return self.travel_times.between(route_name, *segment)
+
+    def stops_between(self, route_name, start, dest):
+        """Stops ridden from start to dest on route_name, both included"""
+        segment = self.stop_index.segment(route_name, start, dest)
+        if segment is None:
+            return []
+        start_idx, end_idx = segment
+        route_stops = self.bus_data[route_name]['stops']
+        if start_idx < end_idx:
+            return route_stops[start_idx:end_idx + 1]
+        return route_stops[start_idx:] + route_stops[:end_idx + 1]
+
+    def departures_for(self, route_name, day_type):
+        """Sorted departures of a route, empty if the route does not run that day"""
+        return self.departures.get((route_name, day_type)) or DepartureIndex()
+
+    def rolling_departures(self, route_name, day_types):
+        """Departures of a route over a rolling horizon (see _rolling_view)"""
+        return self._rolling_view(day_types)[0].get((route_name, day_types)) or DepartureIndex()
+
+    def rolling_network(self, day_types):
+        """TransitNetwork over a rolling horizon (see _rolling_view)"""
+        return self._rolling_view(day_types)[1]
+
+    def rolling_connections(self, day_types):
+        """ConnectionTable over a rolling horizon (see _rolling_view)"""
+        return self._rolling_view(day_types)[2]
+
+    def _rolling_view(self, day_types):
+        """
+        day_types is (previous day, travel day, next day). Trips of the travel
+        day are joined by the last ROLLOVER_MINUTES of the previous day and the
+        first ROLLOVER_MINUTES of the next, with minutes counted from the travel
+        day's midnight, so late-night and early-morning searches can cross it.
+        """
+        view = self._rolling.get(day_types)
+        if view is not None:
+            return view
+
+        with self._rolling_lock:
+            if day_types not in self._rolling:
+                departures = {}
+                for route_name in self.bus_data:
+                    entries = []
+                    for day_offset, day_type in zip((-1, 0, 1), day_types):
+                        shift = day_offset * DAY_MINUTES
+                        route_departures = self.departures_for(route_name, day_type)
+                        for minute, bus in zip(route_departures.minutes, route_departures.buses):
+                            if -ROLLOVER_MINUTES <= minute + shift < DAY_MINUTES + ROLLOVER_MINUTES:
+                                entries.append((minute + shift, bus))
+                    departures[(route_name, day_types)] = DepartureIndex(entries)
+
+                network = TransitNetwork(self.bus_data, departures, day_types, self.stop_index)
+                self._rolling[day_types] = (departures, network, ConnectionTable(network))
+            return self._rolling[day_types]
+
+
+class TimetableStore:
+    """
+    Holds the compiled timetable for this process and recompiles it only
+    after a route, bus or schedule write has bumped the version
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self):
+        """Return the current snapshot, compiling it if the version moved on"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+
+        with self._lock:
+            version = self._version
+            if self._snapshot is None or self._snapshot.version != version:
+                logging.info(f"Compiling timetable version {version}")
+                self._snapshot = CompiledTimetable(self._loader(), version)
+            return self._snapshot
+
+    def invalidate(self):
+        """Bump the version so the next read recompiles from the database"""
+        with self._lock:
+            self._version += 1
+            return self._version
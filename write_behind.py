@@ -0,0 +1,110 @@
+import logging
+import queue
+import threading
+import time
+
+# Set up logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process queue that hands records to write_batch from a
+    background thread, so request handlers never wait on a database commit.
+    Records are written in batches of up to batch_size every flush_interval
+    seconds. When the queue is full new records are dropped and counted
+    rather than blocking the request.
+    """
+
+    def __init__(self, write_batch, max_size=10000, batch_size=500, flush_interval=1.0, name='write-behind'):
+        self._write_batch = write_batch
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.last_flush_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        """Queue record for writing; returns False if it was dropped"""
+        if self._stop.is_set():
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            logging.warning("Write-behind queue full, dropping record")
+            return False
+
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def flush(self):
+        """Write everything queued so far, one batch_size transaction at a time"""
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+
+                started = time.perf_counter()
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logging.error(f"Write-behind batch of {len(batch)} records failed: {str(e)}")
+                    with self._stats_lock:
+                        self.failed += len(batch)
+                    continue
+
+                with self._stats_lock:
+                    self.written += len(batch)
+                    self.batches += 1
+                    self.last_flush_seconds = time.perf_counter() - started
+
+    def close(self, timeout=10):
+        """Stop the writer thread and flush whatever is still queued"""
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stats(self):
+        """Queue depth and throughput counters for spotting backpressure"""
+        with self._stats_lock:
+            return {
+                'depth': self._queue.qsize(),
+                'max_depth': self.max_depth,
+                'max_size': self.max_size,
+                'batch_size': self.batch_size,
+                'flush_interval': self.flush_interval,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_flush_seconds': round(self.last_flush_seconds, 4)
+            }